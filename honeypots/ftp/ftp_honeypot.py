@@ -4,15 +4,19 @@ FTP Honeypot Service
 Captures FTP attacks and logs detailed information
 """
 
-import json
+import itertools
 import logging
 import os
+import signal
+import socket
+import threading
 import time
-from datetime import datetime
+from collections import Counter
+import orjson
+from datasketches import frequent_items_error_type, frequent_strings_sketch, hll_sketch
 from pyftpdlib.authorizers import DummyAuthorizer
 from pyftpdlib.handlers import FTPHandler
 from pyftpdlib.servers import FTPServer
-import requests
 
 # Configure logging
 logging.basicConfig(
@@ -21,50 +25,275 @@ logging.basicConfig(
 )
 logger = logging.getLogger('ftp_honeypot')
 
+# Process start stamp and counter for unique session ids
+_START = f'{int(time.time()):x}'
+_SEQ = itertools.count()
+
+# Service info stamped on every event
+SERVICE_FIELDS = {
+    'service': 'ftp',
+    'honeypot_type': 'ftp_honeypot',
+    'version': '1.0.0'
+}
+
+class TopK:
+    """Bounded heavy-hitter counter backed by a frequent items sketch"""
+    
+    def __init__(self, k=1024, lg_max_map_size=10):
+        self.k = k
+        self.sketch = frequent_strings_sketch(lg_max_map_size)
+
+    def update(self, item):
+        """Count one occurrence of item"""
+        self.sketch.update(item)
+
+    def most_common(self, n=None):
+        """Return up to n (item, estimated_count) pairs, most frequent first"""
+        items = self.sketch.get_frequent_items(frequent_items_error_type.NO_FALSE_NEGATIVES)
+        return [(item, estimate) for item, estimate, _, _ in items[:n or self.k]]
+
+class Event:
+    """Slotted honeypot event, encoded to JSON lines by the log shipper"""
+    __slots__ = ('event_type', 'source_ip', 'username', 'password', 'success', 'attack_type', 'session_id', 'timestamp', 'extra')
+    
+    def __init__(self, event_type, source_ip, username=None, password=None, success=None, attack_type=None, session_id=None, extra=None):
+        self.event_type = event_type
+        self.source_ip = source_ip
+        self.username = username
+        self.password = password
+        self.success = success
+        self.attack_type = attack_type
+        self.session_id = session_id
+        self.timestamp = None
+        self.extra = extra
+
+    def as_dict(self):
+        """Build the JSON document, leaving out unset fields"""
+        document = {
+            'event_type': self.event_type,
+            'source_ip': self.source_ip,
+            'timestamp': self.timestamp
+        }
+        if self.username is not None:
+            document['username'] = self.username
+        if self.password is not None:
+            document['password'] = self.password
+        if self.success is not None:
+            document['success'] = self.success
+        if self.attack_type is not None:
+            document['attack_type'] = self.attack_type
+        if self.session_id is not None:
+            document['session_id'] = self.session_id
+        if self.extra:
+            document.update(self.extra)
+        document.update(SERVICE_FIELDS)
+        return document
+
+class LogstashTCPClient:
+    """Persistent TCP connection to the Logstash json_lines input"""
+    
+    def __init__(self, host, port, max_backoff=30.0):
+        self.host = host
+        self.port = port
+        self.max_backoff = max_backoff
+        self.backoff = 0.5
+        self.retry_at = 0.0
+        self.sock = None
+
+    def connect(self):
+        """Open the connection to Logstash"""
+        sock = socket.create_connection((self.host, self.port), timeout=3)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # Leave Nagle on, writes are already coalesced into large buffers
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 0)
+        self.sock = sock
+        self.backoff = 0.5
+
+    def close(self):
+        """Close the connection and schedule a reconnect"""
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+        
+        # Exponential backoff between reconnect attempts
+        self.retry_at = time.monotonic() + self.backoff
+        self.backoff = min(self.backoff * 2, self.max_backoff)
+
+    def write(self, data):
+        """Send newline-delimited JSON, reconnecting when needed"""
+        if self.sock is None:
+            if time.monotonic() < self.retry_at:
+                return False
+            try:
+                self.connect()
+            except OSError as e:
+                logger.error(f"Failed to connect to Logstash: {e}")
+                self.close()
+                return False
+        
+        try:
+            self.sock.sendall(data)
+            return True
+        except OSError as e:
+            logger.error(f"Failed to send to Logstash: {e}")
+            self.close()
+            return False
+
+class RingBuffer:
+    """Bounded ring buffer that overwrites the oldest entry when full"""
+    
+    def __init__(self, capacity=8192):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.not_empty = threading.Event()
+
+    def push(self, item):
+        """Store item without ever blocking the producer"""
+        with self.lock:
+            if self.head - self.tail >= self.capacity:
+                # Full, drop the oldest entry
+                self.tail += 1
+                self.dropped += 1
+            self.slots[self.head % self.capacity] = item
+            self.head += 1
+        self.not_empty.set()
+
+    def drain(self, max_items):
+        """Remove and return up to max_items entries, oldest first"""
+        with self.lock:
+            count = min(self.head - self.tail, max_items)
+            items = []
+            for _ in range(count):
+                index = self.tail % self.capacity
+                items.append(self.slots[index])
+                self.slots[index] = None
+                self.tail += 1
+            if self.head == self.tail:
+                self.not_empty.clear()
+        return items
+
+    def wait(self, timeout=None):
+        """Wait until at least one entry is available"""
+        return self.not_empty.wait(timeout)
+
+class LogShipper:
+    """Ships honeypot events to file and Logstash from a background thread"""
+    
+    def __init__(self, log_file, logstash_host, logstash_port, flush_bytes=16384, flush_interval=0.1, capacity=8192, drain_size=256, default=None):
+        self.log_file = log_file
+        self.default = default
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.drain_size = drain_size
+        self.events = RingBuffer(capacity)
+        self.client = LogstashTCPClient(logstash_host, logstash_port)
+        
+        # Log file stays open in the shipper thread, reopened on SIGHUP for rotation
+        self.log_handle = None
+        self.reopen_requested = False
+        try:
+            signal.signal(signal.SIGHUP, self.request_reopen)
+        except ValueError:
+            # Signal handlers can only be installed from the main thread
+            pass
+        
+        # Start shipper thread
+        shipper_thread = threading.Thread(target=self.run, name='log_shipper')
+        shipper_thread.daemon = True
+        shipper_thread.start()
+
+    def enqueue(self, event_data):
+        """Queue event for shipping without blocking the caller"""
+        self.events.push(event_data)
+
+    def next_batch(self):
+        """Buffer events as JSON lines until flush_bytes or flush_interval is reached"""
+        buffer = bytearray()
+        self.events.wait()
+        deadline = time.monotonic() + self.flush_interval
+        
+        while True:
+            for event in self.events.drain(self.drain_size):
+                buffer += orjson.dumps(event, default=self.default, option=orjson.OPT_APPEND_NEWLINE)
+            
+            remaining = deadline - time.monotonic()
+            if len(buffer) >= self.flush_bytes or remaining <= 0:
+                break
+            self.events.wait(remaining)
+        
+        return buffer
+
+    def request_reopen(self, signum, frame):
+        """Ask the shipper thread to reopen the log file"""
+        self.reopen_requested = True
+
+    def close_log(self):
+        """Close the log file handle"""
+        if self.log_handle is not None:
+            try:
+                self.log_handle.close()
+            except OSError:
+                pass
+            self.log_handle = None
+
+    def write_batch(self, batch):
+        """Append batch to the local log file, flushing once per batch"""
+        if self.reopen_requested:
+            self.reopen_requested = False
+            self.close_log()
+        
+        try:
+            if self.log_handle is None:
+                self.log_handle = open(self.log_file, 'ab', buffering=1 << 16)
+            self.log_handle.write(batch)
+            self.log_handle.flush()
+        except Exception as e:
+            logger.error(f"Failed to write to log file: {e}")
+            self.close_log()
+
+    def run(self):
+        """Drain the queue and ship events in batches"""
+        while True:
+            batch = self.next_batch()
+            if batch:
+                self.write_batch(batch)
+                self.client.write(batch)
+
 class FTPHoneypot:
     def __init__(self):
         self.logstash_host = os.getenv('LOGSTASH_HOST', 'logstash')
         self.logstash_port = int(os.getenv('LOGSTASH_PORT', '5044'))
+        self.logstash_tcp_port = int(os.getenv('LOGSTASH_TCP_PORT', '5000'))
+        
+        # Background log shipper
+        self.shipper = LogShipper(
+            '/var/log/honeypot/ftp.log',
+            self.logstash_host,
+            self.logstash_tcp_port,
+            default=Event.as_dict
+        )
         
         # Statistics
         self.stats = {
             'total_connections': 0,
             'login_attempts': 0,
-            'unique_ips': set(),
-            'common_usernames': {},
-            'common_passwords': {},
-            'file_operations': {}
+            'unique_ips': hll_sketch(12),
+            'common_usernames': TopK(),
+            'common_passwords': TopK(),
+            'file_operations': Counter()
         }
 
-    def log_event(self, event_data):
-        """Log event to file and send to Logstash"""
-        # Add timestamp and service info
-        event_data.update({
-            'timestamp': datetime.utcnow().isoformat(),
-            'service': 'ftp',
-            'honeypot_type': 'ftp_honeypot',
-            'version': '1.0.0'
-        })
-        
-        # Log to file
-        log_file = '/var/log/honeypot/ftp.log'
-        try:
-            with open(log_file, 'a') as f:
-                f.write(json.dumps(event_data) + '\n')
-        except Exception as e:
-            logger.error(f"Failed to write to log file: {e}")
-        
-        # Send to Logstash
-        try:
-            response = requests.post(
-                f'http://{self.logstash_host}:5000',
-                json=event_data,
-                timeout=5
-            )
-            if response.status_code != 200:
-                logger.warning(f"Failed to send to Logstash: {response.status_code}")
-        except Exception as e:
-            logger.error(f"Failed to send to Logstash: {e}")
+    def log_event(self, event):
+        """Queue event for the log shipper"""
+        event.timestamp = time.time_ns() // 1_000_000
+        self.shipper.enqueue(event)
 
 honeypot = FTPHoneypot()
 
@@ -75,20 +304,18 @@ class HoneypotFTPHandler(FTPHandler):
         """Called when client connects"""
         client_ip = self.remote_ip
         honeypot.stats['total_connections'] += 1
-        honeypot.stats['unique_ips'].add(client_ip)
+        honeypot.stats['unique_ips'].update(client_ip)
         
         logger.info(f"FTP connection from {client_ip}")
         
         # Log connection
-        event_data = {
-            'event_type': 'connection',
-            'source_ip': client_ip,
+        event = Event('connection', client_ip, extra={
             'source_port': self.remote_port,
             'destination_port': 21,
             'protocol': 'ftp',
-            'connection_id': f"{client_ip}_{int(time.time())}"
-        }
-        honeypot.log_event(event_data)
+            'connection_id': f'{client_ip}_{_START}_{next(_SEQ):x}'
+        })
+        honeypot.log_event(event)
 
     def on_disconnect(self):
         """Called when client disconnects"""
@@ -97,12 +324,8 @@ class HoneypotFTPHandler(FTPHandler):
         logger.info(f"FTP disconnection from {client_ip}")
         
         # Log disconnection
-        event_data = {
-            'event_type': 'disconnect',
-            'source_ip': client_ip,
-            'duration': 'unknown'
-        }
-        honeypot.log_event(event_data)
+        event = Event('disconnect', client_ip, extra={'duration': 'unknown'})
+        honeypot.log_event(event)
 
     def on_login(self, username):
         """Called on successful login (shouldn't happen in honeypot)"""
@@ -111,13 +334,8 @@ class HoneypotFTPHandler(FTPHandler):
         logger.warning(f"Unexpected successful login from {client_ip}: {username}")
         
         # Log successful login
-        event_data = {
-            'event_type': 'login_success',
-            'source_ip': client_ip,
-            'username': username,
-            'success': True
-        }
-        honeypot.log_event(event_data)
+        event = Event('login_success', client_ip, username=username, success=True)
+        honeypot.log_event(event)
 
     def on_logout(self, username):
         """Called on logout"""
@@ -126,12 +344,8 @@ class HoneypotFTPHandler(FTPHandler):
         logger.info(f"FTP logout from {client_ip}: {username}")
         
         # Log logout
-        event_data = {
-            'event_type': 'logout',
-            'source_ip': client_ip,
-            'username': username
-        }
-        honeypot.log_event(event_data)
+        event = Event('logout', client_ip, username=username)
+        honeypot.log_event(event)
 
     def on_file_sent(self, file):
         """Called when file is sent to client"""
@@ -140,13 +354,8 @@ class HoneypotFTPHandler(FTPHandler):
         logger.info(f"File sent to {client_ip}: {file}")
         
         # Log file download
-        event_data = {
-            'event_type': 'file_download',
-            'source_ip': client_ip,
-            'filename': file,
-            'attack_type': 'data_exfiltration'
-        }
-        honeypot.log_event(event_data)
+        event = Event('file_download', client_ip, attack_type='data_exfiltration', extra={'filename': file})
+        honeypot.log_event(event)
 
     def on_file_received(self, file):
         """Called when file is received from client"""
@@ -155,13 +364,8 @@ class HoneypotFTPHandler(FTPHandler):
         logger.info(f"File received from {client_ip}: {file}")
         
         # Log file upload
-        event_data = {
-            'event_type': 'file_upload',
-            'source_ip': client_ip,
-            'filename': file,
-            'attack_type': 'malware_upload'
-        }
-        honeypot.log_event(event_data)
+        event = Event('file_upload', client_ip, attack_type='malware_upload', extra={'filename': file})
+        honeypot.log_event(event)
 
 class HoneypotAuthorizer(DummyAuthorizer):
     """Custom authorizer that logs all authentication attempts"""
@@ -171,22 +375,22 @@ class HoneypotAuthorizer(DummyAuthorizer):
         client_ip = handler.remote_ip
         
         honeypot.stats['login_attempts'] += 1
-        honeypot.stats['common_usernames'][username] = honeypot.stats['common_usernames'].get(username, 0) + 1
-        honeypot.stats['common_passwords'][password] = honeypot.stats['common_passwords'].get(password, 0) + 1
+        honeypot.stats['common_usernames'].update(username)
+        honeypot.stats['common_passwords'].update(password)
         
         logger.info(f"FTP login attempt from {client_ip}: {username}:{password}")
         
         # Log authentication attempt
-        event_data = {
-            'event_type': 'login_attempt',
-            'source_ip': client_ip,
-            'username': username,
-            'password': password,
-            'success': False,
-            'attack_type': 'brute_force',
-            'session_id': f"{client_ip}_{int(time.time())}"
-        }
-        honeypot.log_event(event_data)
+        event = Event(
+            'login_attempt',
+            client_ip,
+            username=username,
+            password=password,
+            success=False,
+            attack_type='brute_force',
+            session_id=f'{client_ip}_{_START}_{next(_SEQ):x}'
+        )
+        honeypot.log_event(event)
         
         # Always deny authentication for honeypot
         raise Exception("Authentication failed")
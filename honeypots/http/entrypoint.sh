@@ -5,6 +5,10 @@ set -e
 mkdir -p /var/log/honeypot
 chown honeypot:honeypot /var/log/honeypot
 
+# Two workers per CPU by default, each with a small thread pool
+WORKERS=${HTTP_WORKERS:-$((2 * $(nproc)))}
+
 # Start HTTP honeypot
 echo "Starting HTTP honeypot..."
-exec python3 /app/http_honeypot.py
\ No newline at end of file
+exec gunicorn --bind 0.0.0.0:80 --workers "$WORKERS" --worker-class gthread --threads 8 \
+    --keep-alive 30 --reuse-port http_honeypot:app
\ No newline at end of file
@@ -4,13 +4,17 @@ HTTP Honeypot Service
 Captures web application attacks and logs detailed information
 """
 
-import json
 import logging
 import os
+import signal
+import socket
+import threading
 import time
-from datetime import datetime
-from flask import Flask, request, render_template_string, jsonify, redirect
-import requests
+from collections import Counter
+from flask import Flask, request, jsonify, redirect
+import ahocorasick
+import orjson
+from datasketches import hll_sketch
 
 # Configure logging
 logging.basicConfig(
@@ -21,98 +25,284 @@ logger = logging.getLogger('http_honeypot')
 
 app = Flask(__name__)
 
+# Attack signatures matched against the lowercased request URI
+URI_SIGNATURES = {
+    'sql_injection': frozenset(['union', 'select', 'insert', 'update', 'delete', 'drop', 'create', 'alter', "'", '"', '--', '/*']),
+    'xss': frozenset(['<script', 'javascript:', 'onload=', 'onerror=', 'alert(', 'document.cookie']),
+    'directory_traversal': frozenset(['../', '..\\']),
+    'admin_access': frozenset(['admin', 'wp-admin', 'phpmyadmin', 'login', 'administrator', 'manager']),
+    'file_inclusion': frozenset(['include', 'require']),
+    'command_injection': frozenset(['|', ';', '&&', '||', '`', '$', '$('])
+}
+
+# Attack signatures matched against the lowercased User-Agent header
+USER_AGENT_SIGNATURES = {
+    'automated_scan': frozenset(['bot', 'crawler', 'scanner', 'nikto', 'sqlmap', 'nmap', 'masscan'])
+}
+
+# Reporting order and threat level of each attack category
+ATTACK_CATEGORIES = (
+    'sql_injection', 'xss', 'directory_traversal', 'admin_access',
+    'automated_scan', 'file_inclusion', 'command_injection'
+)
+ATTACK_THREAT_LEVELS = {
+    'sql_injection': 'high',
+    'xss': 'high',
+    'directory_traversal': 'medium',
+    'admin_access': 'medium',
+    'automated_scan': 'medium',
+    'file_inclusion': 'high',
+    'command_injection': 'high'
+}
+THREAT_LEVEL_WEIGHTS = {'low': 0, 'medium': 1, 'high': 2}
+
+# Request headers worth keeping in the event log
+LOGGED_HEADERS = (
+    'User-Agent', 'Referer', 'Host', 'X-Forwarded-For',
+    'Content-Type', 'Content-Length', 'Authorization'
+)
+
+def build_automaton(signatures):
+    """Compile signatures into an Aho-Corasick automaton of pattern -> categories"""
+    automaton = ahocorasick.Automaton()
+    for category, patterns in signatures.items():
+        for pattern in patterns:
+            pattern = pattern.lower()
+            categories = automaton.get(pattern, ())
+            if category not in categories:
+                automaton.add_word(pattern, categories + (category,))
+    automaton.make_automaton()
+    return automaton
+
+URI_AUTOMATON = build_automaton(URI_SIGNATURES)
+USER_AGENT_AUTOMATON = build_automaton(USER_AGENT_SIGNATURES)
+
+class LogstashTCPClient:
+    """Persistent TCP connection to the Logstash json_lines input"""
+    
+    def __init__(self, host, port, max_backoff=30.0):
+        self.host = host
+        self.port = port
+        self.max_backoff = max_backoff
+        self.backoff = 0.5
+        self.retry_at = 0.0
+        self.sock = None
+
+    def connect(self):
+        """Open the connection to Logstash"""
+        sock = socket.create_connection((self.host, self.port), timeout=3)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # Leave Nagle on, writes are already coalesced into large buffers
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 0)
+        self.sock = sock
+        self.backoff = 0.5
+
+    def close(self):
+        """Close the connection and schedule a reconnect"""
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+        
+        # Exponential backoff between reconnect attempts
+        self.retry_at = time.monotonic() + self.backoff
+        self.backoff = min(self.backoff * 2, self.max_backoff)
+
+    def write(self, data):
+        """Send newline-delimited JSON, reconnecting when needed"""
+        if self.sock is None:
+            if time.monotonic() < self.retry_at:
+                return False
+            try:
+                self.connect()
+            except OSError as e:
+                logger.error(f"Failed to connect to Logstash: {e}")
+                self.close()
+                return False
+        
+        try:
+            self.sock.sendall(data)
+            return True
+        except OSError as e:
+            logger.error(f"Failed to send to Logstash: {e}")
+            self.close()
+            return False
+
+class RingBuffer:
+    """Bounded ring buffer that overwrites the oldest entry when full"""
+    
+    def __init__(self, capacity=8192):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.not_empty = threading.Event()
+
+    def push(self, item):
+        """Store item without ever blocking the producer"""
+        with self.lock:
+            if self.head - self.tail >= self.capacity:
+                # Full, drop the oldest entry
+                self.tail += 1
+                self.dropped += 1
+            self.slots[self.head % self.capacity] = item
+            self.head += 1
+        self.not_empty.set()
+
+    def drain(self, max_items):
+        """Remove and return up to max_items entries, oldest first"""
+        with self.lock:
+            count = min(self.head - self.tail, max_items)
+            items = []
+            for _ in range(count):
+                index = self.tail % self.capacity
+                items.append(self.slots[index])
+                self.slots[index] = None
+                self.tail += 1
+            if self.head == self.tail:
+                self.not_empty.clear()
+        return items
+
+    def wait(self, timeout=None):
+        """Wait until at least one entry is available"""
+        return self.not_empty.wait(timeout)
+
+class LogShipper:
+    """Ships honeypot events to file and Logstash from a background thread"""
+    
+    def __init__(self, log_file, logstash_host, logstash_port, flush_bytes=16384, flush_interval=0.1, capacity=8192, drain_size=256):
+        self.log_file = log_file
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.drain_size = drain_size
+        self.events = RingBuffer(capacity)
+        self.client = LogstashTCPClient(logstash_host, logstash_port)
+        
+        # Log file stays open in the shipper thread, reopened on SIGHUP for rotation
+        self.log_handle = None
+        self.reopen_requested = False
+        try:
+            signal.signal(signal.SIGHUP, self.request_reopen)
+        except ValueError:
+            # Signal handlers can only be installed from the main thread
+            pass
+        
+        # Start shipper thread
+        shipper_thread = threading.Thread(target=self.run, name='log_shipper')
+        shipper_thread.daemon = True
+        shipper_thread.start()
+
+    def enqueue(self, event_data):
+        """Queue event for shipping without blocking the caller"""
+        self.events.push(event_data)
+
+    def next_batch(self):
+        """Buffer events as JSON lines until flush_bytes or flush_interval is reached"""
+        buffer = bytearray()
+        self.events.wait()
+        deadline = time.monotonic() + self.flush_interval
+        
+        while True:
+            for event in self.events.drain(self.drain_size):
+                buffer += orjson.dumps(event, option=orjson.OPT_APPEND_NEWLINE)
+            
+            remaining = deadline - time.monotonic()
+            if len(buffer) >= self.flush_bytes or remaining <= 0:
+                break
+            self.events.wait(remaining)
+        
+        return buffer
+
+    def request_reopen(self, signum, frame):
+        """Ask the shipper thread to reopen the log file"""
+        self.reopen_requested = True
+
+    def close_log(self):
+        """Close the log file handle"""
+        if self.log_handle is not None:
+            try:
+                self.log_handle.close()
+            except OSError:
+                pass
+            self.log_handle = None
+
+    def write_batch(self, batch):
+        """Append batch to the local log file, flushing once per batch"""
+        if self.reopen_requested:
+            self.reopen_requested = False
+            self.close_log()
+        
+        try:
+            if self.log_handle is None:
+                self.log_handle = open(self.log_file, 'ab', buffering=1 << 16)
+            self.log_handle.write(batch)
+            self.log_handle.flush()
+        except Exception as e:
+            logger.error(f"Failed to write to log file: {e}")
+            self.close_log()
+
+    def run(self):
+        """Drain the queue and ship events in batches"""
+        while True:
+            batch = self.next_batch()
+            if batch:
+                self.write_batch(batch)
+                self.client.write(batch)
+
 class HTTPHoneypot:
     def __init__(self):
         self.logstash_host = os.getenv('LOGSTASH_HOST', 'logstash')
         self.logstash_port = int(os.getenv('LOGSTASH_PORT', '5044'))
+        self.logstash_tcp_port = int(os.getenv('LOGSTASH_TCP_PORT', '5000'))
+        
+        # Background log shipper
+        self.shipper = LogShipper(
+            '/var/log/honeypot/http.log',
+            self.logstash_host,
+            self.logstash_tcp_port
+        )
         
         # Statistics
         self.stats = {
             'total_requests': 0,
-            'unique_ips': set(),
-            'attack_types': {},
-            'user_agents': {},
-            'request_methods': {}
+            'unique_ips': hll_sketch(12),
+            'attack_types': Counter(),
+            'user_agents': Counter(),
+            'request_methods': Counter()
         }
 
     def log_event(self, event_data):
-        """Log event to file and send to Logstash"""
+        """Queue event for the log shipper"""
         # Add timestamp and service info
         event_data.update({
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': time.time_ns() // 1_000_000,
             'service': 'http',
             'honeypot_type': 'http_honeypot',
             'version': '1.0.0'
         })
         
-        # Log to file
-        log_file = '/var/log/honeypot/http.log'
-        try:
-            with open(log_file, 'a') as f:
-                f.write(json.dumps(event_data) + '\n')
-        except Exception as e:
-            logger.error(f"Failed to write to log file: {e}")
-        
-        # Send to Logstash
-        try:
-            response = requests.post(
-                f'http://{self.logstash_host}:5000',
-                json=event_data,
-                timeout=5
-            )
-            if response.status_code != 200:
-                logger.warning(f"Failed to send to Logstash: {response.status_code}")
-        except Exception as e:
-            logger.error(f"Failed to send to Logstash: {e}")
+        self.shipper.enqueue(event_data)
 
     def analyze_request(self, request_data):
         """Analyze request for attack patterns"""
-        attack_types = []
-        threat_level = 'low'
-        
+        # Lowercase each field once, signatures are stored lowercased
         uri = request_data.get('request_uri', '').lower()
         user_agent = request_data.get('user_agent', '').lower()
-        method = request_data.get('method', '')
         
-        # SQL Injection detection
-        sql_patterns = ['union', 'select', 'insert', 'update', 'delete', 'drop', 'create', 'alter', "'", '"', '--', '/*']
-        if any(pattern in uri for pattern in sql_patterns):
-            attack_types.append('sql_injection')
-            threat_level = 'high'
+        # Single pass over each field matches every signature at once
+        detected = set()
+        if uri:
+            detected.update(category for _, categories in URI_AUTOMATON.iter(uri) for category in categories)
+        if user_agent:
+            detected.update(category for _, categories in USER_AGENT_AUTOMATON.iter(user_agent) for category in categories)
         
-        # XSS detection
-        xss_patterns = ['<script', 'javascript:', 'onload=', 'onerror=', 'alert(', 'document.cookie']
-        if any(pattern in uri for pattern in xss_patterns):
-            attack_types.append('xss')
-            threat_level = 'high'
-        
-        # Directory traversal
-        if '../' in uri or '..\\' in uri:
-            attack_types.append('directory_traversal')
-            threat_level = 'medium'
-        
-        # Admin panel access
-        admin_patterns = ['admin', 'wp-admin', 'phpmyadmin', 'login', 'administrator', 'manager']
-        if any(pattern in uri for pattern in admin_patterns):
-            attack_types.append('admin_access')
-            threat_level = 'medium'
-        
-        # Automated scanning
-        scanner_agents = ['bot', 'crawler', 'scanner', 'nikto', 'sqlmap', 'nmap', 'masscan']
-        if any(agent in user_agent for agent in scanner_agents):
-            attack_types.append('automated_scan')
-            threat_level = 'medium'
-        
-        # File inclusion
-        if 'include' in uri or 'require' in uri:
-            attack_types.append('file_inclusion')
-            threat_level = 'high'
-        
-        # Command injection
-        cmd_patterns = ['|', ';', '&&', '||', '`', '$', '$(']
-        if any(pattern in uri for pattern in cmd_patterns):
-            attack_types.append('command_injection')
-            threat_level = 'high'
+        attack_types = [category for category in ATTACK_CATEGORIES if category in detected]
+        threat_level = max((ATTACK_THREAT_LEVELS[category] for category in attack_types),
+                           key=THREAT_LEVEL_WEIGHTS.get, default='low')
         
         return attack_types, threat_level
 
@@ -124,27 +314,33 @@ def log_request():
     client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
     
     honeypot.stats['total_requests'] += 1
-    honeypot.stats['unique_ips'].add(client_ip)
+    honeypot.stats['unique_ips'].update(client_ip)
     
     method = request.method
-    honeypot.stats['request_methods'][method] = honeypot.stats['request_methods'].get(method, 0) + 1
+    honeypot.stats['request_methods'][method] += 1
     
     user_agent = request.headers.get('User-Agent', '')
-    honeypot.stats['user_agents'][user_agent] = honeypot.stats['user_agents'].get(user_agent, 0) + 1
+    honeypot.stats['user_agents'][user_agent] += 1
+    
+    # Build the URI from the raw WSGI environ instead of request.full_path
+    environ = request.environ
+    path = environ.get('PATH_INFO', '')
+    query_string = environ.get('QUERY_STRING', '')
+    request_uri = f"{path}?{query_string}" if query_string else path
     
     # Prepare request data
     request_data = {
         'event_type': 'http_request',
         'source_ip': client_ip,
         'method': method,
-        'request_uri': request.full_path,
+        'request_uri': request_uri,
         'user_agent': user_agent,
         'referer': request.headers.get('Referer', ''),
         'content_type': request.headers.get('Content-Type', ''),
         'content_length': request.headers.get('Content-Length', ''),
-        'headers': dict(request.headers),
-        'query_string': request.query_string.decode('utf-8'),
-        'form_data': dict(request.form) if request.form else {},
+        'headers': {name: request.headers[name] for name in LOGGED_HEADERS if name in request.headers},
+        'query_string': query_string,
+        'form_data': dict(request.form) if environ.get('CONTENT_TYPE', '').startswith('application/x-www-form-urlencoded') else {},
         'session_id': f"{client_ip}_{int(time.time())}"
     }
     
@@ -154,16 +350,100 @@ def log_request():
     request_data['threat_level'] = threat_level
     
     # Update statistics
-    for attack_type in attack_types:
-        honeypot.stats['attack_types'][attack_type] = honeypot.stats['attack_types'].get(attack_type, 0) + 1
+    honeypot.stats['attack_types'].update(attack_types)
     
     # Log the request
     honeypot.log_event(request_data)
     
-    logger.info(f"Request from {client_ip}: {method} {request.full_path}")
+    logger.info(f"Request from {client_ip}: {method} {request_uri}")
     if attack_types:
         logger.warning(f"Detected attacks from {client_ip}: {attack_types}")
 
+# Static pages, built once at import instead of rendered per request
+INDEX_HTML = b"""<html>
+<head><title>Welcome</title></head>
+<body>
+<h1>Welcome to Our Website</h1>
+<p>This is a sample web application.</p>
+<ul>
+    <li><a href="/login">Admin Login</a></li>
+    <li><a href="/filemanager">File Manager</a></li>
+    <li><a href="/phpmyadmin">Database</a></li>
+    <li><a href="/api/users">API Users</a></li>
+</ul>
+</body>
+</html>
+"""
+
+LOGIN_FORM_HTML = b"""<html>
+<head><title>Admin Login</title></head>
+<body>
+<h2>Administrator Login</h2>
+<form method="post">
+    <p>Username: <input type="text" name="username" required></p>
+    <p>Password: <input type="password" name="password" required></p>
+    <p><input type="submit" value="Login"></p>
+</form>
+</body>
+</html>
+"""
+
+LOGIN_FAILED_HTML = b"""<html>
+<head><title>Login Failed</title></head>
+<body>
+<h2>Login Failed</h2>
+<p>Invalid credentials. Please try again.</p>
+<a href="/login">Back to Login</a>
+</body>
+</html>
+"""
+
+FILE_MANAGER_HTML = b"""<html>
+<head><title>File Manager</title></head>
+<body>
+<h2>File Manager</h2>
+<ul>
+    <li><a href="/files/config.php">config.php</a></li>
+    <li><a href="/files/database.sql">database.sql</a></li>
+    <li><a href="/files/passwords.txt">passwords.txt</a></li>
+    <li><a href="/files/backup.zip">backup.zip</a></li>
+</ul>
+</body>
+</html>
+"""
+
+DATABASE_HTML = b"""<html>
+<head><title>phpMyAdmin</title></head>
+<body>
+<h2>phpMyAdmin 4.9.5</h2>
+<p>MySQL Database Administration</p>
+<form method="post" action="/phpmyadmin/login">
+    <p>Username: <input type="text" name="pma_username"></p>
+    <p>Password: <input type="password" name="pma_password"></p>
+    <p><input type="submit" value="Go"></p>
+</form>
+</body>
+</html>
+"""
+
+ROBOTS_TXT = b"""User-agent: *
+Disallow: /admin/
+Disallow: /config/
+Disallow: /backup/
+Disallow: /database/
+"""
+
+# Only the 404 page has a variable, compiled once with Flask's autoescaping environment
+NOT_FOUND_TEMPLATE = app.jinja_env.from_string("""<html>
+<head><title>404 Not Found</title></head>
+<body>
+<h2>404 - Page Not Found</h2>
+<p>The requested page "{{ path }}" was not found.</p>
+<a href="/">Home</a>
+</body>
+</html>
+""")
+
 # Fake login page
 @app.route('/login', methods=['GET', 'POST'])
 @app.route('/admin', methods=['GET', 'POST'])
@@ -184,68 +464,21 @@ def fake_login():
         }
         honeypot.log_event(login_event)
         
-        return render_template_string("""
-        <html>
-        <head><title>Login Failed</title></head>
-        <body>
-        <h2>Login Failed</h2>
-        <p>Invalid credentials. Please try again.</p>
-        <a href="/login">Back to Login</a>
-        </body>
-        </html>
-        """)
+        return LOGIN_FAILED_HTML
     
-    return render_template_string("""
-    <html>
-    <head><title>Admin Login</title></head>
-    <body>
-    <h2>Administrator Login</h2>
-    <form method="post">
-        <p>Username: <input type="text" name="username" required></p>
-        <p>Password: <input type="password" name="password" required></p>
-        <p><input type="submit" value="Login"></p>
-    </form>
-    </body>
-    </html>
-    """)
+    return LOGIN_FORM_HTML
 
 # Fake file manager
 @app.route('/filemanager')
 @app.route('/files')
 def fake_filemanager():
-    return render_template_string("""
-    <html>
-    <head><title>File Manager</title></head>
-    <body>
-    <h2>File Manager</h2>
-    <ul>
-        <li><a href="/files/config.php">config.php</a></li>
-        <li><a href="/files/database.sql">database.sql</a></li>
-        <li><a href="/files/passwords.txt">passwords.txt</a></li>
-        <li><a href="/files/backup.zip">backup.zip</a></li>
-    </ul>
-    </body>
-    </html>
-    """)
+    return FILE_MANAGER_HTML
 
 # Fake database interface
 @app.route('/phpmyadmin')
 @app.route('/database')
 def fake_database():
-    return render_template_string("""
-    <html>
-    <head><title>phpMyAdmin</title></head>
-    <body>
-    <h2>phpMyAdmin 4.9.5</h2>
-    <p>MySQL Database Administration</p>
-    <form method="post" action="/phpmyadmin/login">
-        <p>Username: <input type="text" name="pma_username"></p>
-        <p>Password: <input type="password" name="pma_password"></p>
-        <p><input type="submit" value="Go"></p>
-    </form>
-    </body>
-    </html>
-    """)
+    return DATABASE_HTML
 
 # Vulnerable endpoints for testing
 @app.route('/search')
@@ -282,44 +515,16 @@ def api_config():
 # Default routes
 @app.route('/')
 def index():
-    return render_template_string("""
-    <html>
-    <head><title>Welcome</title></head>
-    <body>
-    <h1>Welcome to Our Website</h1>
-    <p>This is a sample web application.</p>
-    <ul>
-        <li><a href="/login">Admin Login</a></li>
-        <li><a href="/filemanager">File Manager</a></li>
-        <li><a href="/phpmyadmin">Database</a></li>
-        <li><a href="/api/users">API Users</a></li>
-    </ul>
-    </body>
-    </html>
-    """)
+    return INDEX_HTML
 
 @app.route('/robots.txt')
 def robots():
-    return """User-agent: *
-Disallow: /admin/
-Disallow: /config/
-Disallow: /backup/
-Disallow: /database/
-"""
+    return ROBOTS_TXT
 
 # Catch-all route
 @app.route('/<path:path>')
 def catch_all(path):
-    return render_template_string("""
-    <html>
-    <head><title>404 Not Found</title></head>
-    <body>
-    <h2>404 - Page Not Found</h2>
-    <p>The requested page "{{ path }}" was not found.</p>
-    <a href="/">Home</a>
-    </body>
-    </html>
-    """, path=path), 404
+    return NOT_FOUND_TEMPLATE.render(path=path), 404
 
 if __name__ == '__main__':
     logger.info("Starting HTTP honeypot on port 80")
@@ -4,14 +4,17 @@ SSH Honeypot Service
 Captures SSH brute force attacks and logs detailed information
 """
 
-import json
+import itertools
 import logging
+import signal
 import socket
 import threading
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+import orjson
+from datasketches import frequent_items_error_type, frequent_strings_sketch, hll_sketch
 import paramiko
-import requests
 import os
 
 # Configure logging
@@ -21,82 +24,348 @@ logging.basicConfig(
 )
 logger = logging.getLogger('ssh_honeypot')
 
+# Process start stamp and counter for unique session ids
+_START = f'{int(time.time()):x}'
+_SEQ = itertools.count()
+
+# Service info stamped on every event
+SERVICE_FIELDS = {
+    'service': 'ssh',
+    'honeypot_type': 'ssh_honeypot',
+    'version': '1.0.0'
+}
+
+# Version string presented to clients
+SERVER_VERSION = 'SSH-2.0-OpenSSH_8.9'
+
+class TopK:
+    """Bounded heavy-hitter counter backed by a frequent items sketch"""
+    
+    def __init__(self, k=1024, lg_max_map_size=10):
+        self.k = k
+        self.sketch = frequent_strings_sketch(lg_max_map_size)
+
+    def update(self, item):
+        """Count one occurrence of item"""
+        self.sketch.update(item)
+
+    def most_common(self, n=None):
+        """Return up to n (item, estimated_count) pairs, most frequent first"""
+        items = self.sketch.get_frequent_items(frequent_items_error_type.NO_FALSE_NEGATIVES)
+        return [(item, estimate) for item, estimate, _, _ in items[:n or self.k]]
+
+class Event:
+    """Slotted honeypot event, encoded to JSON lines by the log shipper"""
+    __slots__ = ('event_type', 'source_ip', 'username', 'password', 'success', 'attack_type', 'session_id', 'timestamp', 'extra')
+    
+    def __init__(self, event_type, source_ip, username=None, password=None, success=None, attack_type=None, session_id=None, extra=None):
+        self.event_type = event_type
+        self.source_ip = source_ip
+        self.username = username
+        self.password = password
+        self.success = success
+        self.attack_type = attack_type
+        self.session_id = session_id
+        self.timestamp = None
+        self.extra = extra
+
+    def as_dict(self):
+        """Build the JSON document, leaving out unset fields"""
+        document = {
+            'event_type': self.event_type,
+            'source_ip': self.source_ip,
+            'timestamp': self.timestamp
+        }
+        if self.username is not None:
+            document['username'] = self.username
+        if self.password is not None:
+            document['password'] = self.password
+        if self.success is not None:
+            document['success'] = self.success
+        if self.attack_type is not None:
+            document['attack_type'] = self.attack_type
+        if self.session_id is not None:
+            document['session_id'] = self.session_id
+        if self.extra:
+            document.update(self.extra)
+        document.update(SERVICE_FIELDS)
+        return document
+
+class LogstashTCPClient:
+    """Persistent TCP connection to the Logstash json_lines input"""
+    
+    def __init__(self, host, port, max_backoff=30.0):
+        self.host = host
+        self.port = port
+        self.max_backoff = max_backoff
+        self.backoff = 0.5
+        self.retry_at = 0.0
+        self.sock = None
+
+    def connect(self):
+        """Open the connection to Logstash"""
+        sock = socket.create_connection((self.host, self.port), timeout=3)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # Leave Nagle on, writes are already coalesced into large buffers
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 0)
+        self.sock = sock
+        self.backoff = 0.5
+
+    def close(self):
+        """Close the connection and schedule a reconnect"""
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+        
+        # Exponential backoff between reconnect attempts
+        self.retry_at = time.monotonic() + self.backoff
+        self.backoff = min(self.backoff * 2, self.max_backoff)
+
+    def write(self, data):
+        """Send newline-delimited JSON, reconnecting when needed"""
+        if self.sock is None:
+            if time.monotonic() < self.retry_at:
+                return False
+            try:
+                self.connect()
+            except OSError as e:
+                logger.error(f"Failed to connect to Logstash: {e}")
+                self.close()
+                return False
+        
+        try:
+            self.sock.sendall(data)
+            return True
+        except OSError as e:
+            logger.error(f"Failed to send to Logstash: {e}")
+            self.close()
+            return False
+
+class RingBuffer:
+    """Bounded ring buffer that overwrites the oldest entry when full"""
+    
+    def __init__(self, capacity=8192):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.not_empty = threading.Event()
+
+    def push(self, item):
+        """Store item without ever blocking the producer"""
+        with self.lock:
+            if self.head - self.tail >= self.capacity:
+                # Full, drop the oldest entry
+                self.tail += 1
+                self.dropped += 1
+            self.slots[self.head % self.capacity] = item
+            self.head += 1
+        self.not_empty.set()
+
+    def drain(self, max_items):
+        """Remove and return up to max_items entries, oldest first"""
+        with self.lock:
+            count = min(self.head - self.tail, max_items)
+            items = []
+            for _ in range(count):
+                index = self.tail % self.capacity
+                items.append(self.slots[index])
+                self.slots[index] = None
+                self.tail += 1
+            if self.head == self.tail:
+                self.not_empty.clear()
+        return items
+
+    def wait(self, timeout=None):
+        """Wait until at least one entry is available"""
+        return self.not_empty.wait(timeout)
+
+class LogShipper:
+    """Ships honeypot events to file and Logstash from a background thread"""
+    
+    def __init__(self, log_file, logstash_host, logstash_port, flush_bytes=16384, flush_interval=0.1, capacity=8192, drain_size=256, default=None):
+        self.log_file = log_file
+        self.default = default
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.drain_size = drain_size
+        self.events = RingBuffer(capacity)
+        self.client = LogstashTCPClient(logstash_host, logstash_port)
+        
+        # Log file stays open in the shipper thread, reopened on SIGHUP for rotation
+        self.log_handle = None
+        self.reopen_requested = False
+        try:
+            signal.signal(signal.SIGHUP, self.request_reopen)
+        except ValueError:
+            # Signal handlers can only be installed from the main thread
+            pass
+        
+        # Start shipper thread
+        shipper_thread = threading.Thread(target=self.run, name='log_shipper')
+        shipper_thread.daemon = True
+        shipper_thread.start()
+
+    def enqueue(self, event_data):
+        """Queue event for shipping without blocking the caller"""
+        self.events.push(event_data)
+
+    def next_batch(self):
+        """Buffer events as JSON lines until flush_bytes or flush_interval is reached"""
+        buffer = bytearray()
+        self.events.wait()
+        deadline = time.monotonic() + self.flush_interval
+        
+        while True:
+            for event in self.events.drain(self.drain_size):
+                buffer += orjson.dumps(event, default=self.default, option=orjson.OPT_APPEND_NEWLINE)
+            
+            remaining = deadline - time.monotonic()
+            if len(buffer) >= self.flush_bytes or remaining <= 0:
+                break
+            self.events.wait(remaining)
+        
+        return buffer
+
+    def request_reopen(self, signum, frame):
+        """Ask the shipper thread to reopen the log file"""
+        self.reopen_requested = True
+
+    def close_log(self):
+        """Close the log file handle"""
+        if self.log_handle is not None:
+            try:
+                self.log_handle.close()
+            except OSError:
+                pass
+            self.log_handle = None
+
+    def write_batch(self, batch):
+        """Append batch to the local log file, flushing once per batch"""
+        if self.reopen_requested:
+            self.reopen_requested = False
+            self.close_log()
+        
+        try:
+            if self.log_handle is None:
+                self.log_handle = open(self.log_file, 'ab', buffering=1 << 16)
+            self.log_handle.write(batch)
+            self.log_handle.flush()
+        except Exception as e:
+            logger.error(f"Failed to write to log file: {e}")
+            self.close_log()
+
+    def run(self):
+        """Drain the queue and ship events in batches"""
+        while True:
+            batch = self.next_batch()
+            if batch:
+                self.write_batch(batch)
+                self.client.write(batch)
+
 class SSHHoneypot:
-    def __init__(self, host='0.0.0.0', port=22):
+    def __init__(self, host='0.0.0.0', port=22, max_workers=256):
         self.host = host
         self.port = port
+        self.max_workers = max_workers
         self.logstash_host = os.getenv('LOGSTASH_HOST', 'logstash')
         self.logstash_port = int(os.getenv('LOGSTASH_PORT', '5044'))
+        self.logstash_tcp_port = int(os.getenv('LOGSTASH_TCP_PORT', '5000'))
+        
+        # Background log shipper
+        self.shipper = LogShipper(
+            '/var/log/honeypot/ssh.log',
+            self.logstash_host,
+            self.logstash_tcp_port,
+            default=Event.as_dict
+        )
         
-        # Generate server key
-        self.server_key = paramiko.RSAKey.generate(2048)
+        # Load persisted server key (generated on first run)
+        self.server_key = self.load_server_key(os.getenv('SSH_KEY', '/var/lib/honeypot/ssh_host.key'))
         
         # Statistics
         self.stats = {
             'total_connections': 0,
             'auth_attempts': 0,
-            'unique_ips': set(),
-            'common_usernames': {},
-            'common_passwords': {}
+            'unique_ips': hll_sketch(12),
+            'common_usernames': TopK(),
+            'common_passwords': TopK()
         }
-
-    def log_event(self, event_data):
-        """Log event to file and send to Logstash"""
-        # Add timestamp and service info
-        event_data.update({
-            'timestamp': datetime.utcnow().isoformat(),
-            'service': 'ssh',
-            'honeypot_type': 'ssh_honeypot',
-            'version': '1.0.0'
-        })
         
-        # Log to file
-        log_file = '/var/log/honeypot/ssh.log'
-        try:
-            with open(log_file, 'a') as f:
-                f.write(json.dumps(event_data) + '\n')
-        except Exception as e:
-            logger.error(f"Failed to write to log file: {e}")
-        
-        # Send to Logstash
+        # Auth attempts per source IP over the last few minutes
+        self.scanner_threshold = int(os.getenv('SSH_SCANNER_THRESHOLD', '10'))
+        self.scanner_cache = TTLCache(maxsize=100000, ttl=300)
+        self.scanner_lock = threading.Lock()
+
+    def load_server_key(self, key_path):
+        """Load the RSA host key, generating and saving it if missing"""
         try:
-            response = requests.post(
-                f'http://{self.logstash_host}:5000',
-                json=event_data,
-                timeout=5
-            )
-            if response.status_code != 200:
-                logger.warning(f"Failed to send to Logstash: {response.status_code}")
-        except Exception as e:
-            logger.error(f"Failed to send to Logstash: {e}")
+            return paramiko.RSAKey(filename=key_path)
+        except FileNotFoundError:
+            logger.info(f"Generating new SSH host key at {key_path}")
+            server_key = paramiko.RSAKey.generate(2048)
+            try:
+                os.makedirs(os.path.dirname(key_path), exist_ok=True)
+                server_key.write_private_key_file(key_path)
+            except OSError as e:
+                logger.warning(f"Could not save SSH host key: {e}")
+            return server_key
+
+    def log_event(self, event):
+        """Queue event for the log shipper"""
+        event.timestamp = time.time_ns() // 1_000_000
+        self.shipper.enqueue(event)
 
     def handle_auth(self, username, password, client_ip):
         """Handle authentication attempt"""
         self.stats['auth_attempts'] += 1
-        self.stats['unique_ips'].add(client_ip)
+        self.stats['unique_ips'].update(client_ip)
         
         # Track common credentials
-        self.stats['common_usernames'][username] = self.stats['common_usernames'].get(username, 0) + 1
-        self.stats['common_passwords'][password] = self.stats['common_passwords'].get(password, 0) + 1
+        self.stats['common_usernames'].update(username)
+        self.stats['common_passwords'].update(password)
+        
+        # Track repeat offenders for the banner-only fast path
+        with self.scanner_lock:
+            self.scanner_cache[client_ip] = self.scanner_cache.get(client_ip, 0) + 1
         
         # Log authentication attempt
-        event_data = {
-            'event_type': 'auth_attempt',
-            'source_ip': client_ip,
-            'username': username,
-            'password': password,
-            'success': False,
-            'session_id': f"{client_ip}_{int(time.time())}",
-            'user_agent': 'ssh_client',
-            'attack_type': 'brute_force'
-        }
+        event = Event(
+            'auth_attempt',
+            client_ip,
+            username=username,
+            password=password,
+            success=False,
+            attack_type='brute_force',
+            session_id=f'{client_ip}_{_START}_{next(_SEQ):x}',
+            extra={'user_agent': 'ssh_client'}
+        )
         
-        self.log_event(event_data)
+        self.log_event(event)
         logger.info(f"Auth attempt from {client_ip}: {username}:{password}")
         
         # Always return failure for honeypot
         return False
 
+    def is_known_scanner(self, client_ip):
+        """Check whether client_ip recently exceeded the auth attempt threshold"""
+        with self.scanner_lock:
+            return self.scanner_cache.get(client_ip, 0) >= self.scanner_threshold
+
+    def exchange_banner(self, client_socket, client_ip):
+        """Swap version strings with the client without starting key exchange"""
+        client_socket.settimeout(5)
+        client_socket.sendall(f"{SERVER_VERSION}\r\n".encode())
+        client_version = client_socket.recv(255).split(b'\r\n', 1)[0].decode('utf-8', errors='ignore')
+        
+        banner_event = Event('client_banner', client_ip, attack_type='brute_force', extra={'client_version': client_version})
+        self.log_event(banner_event)
+
     def handle_client(self, client_socket, client_addr):
         """Handle individual client connection"""
         client_ip = client_addr[0]
@@ -105,19 +374,25 @@ class SSHHoneypot:
         logger.info(f"New connection from {client_ip}")
         
         # Log connection
-        connection_event = {
-            'event_type': 'connection',
-            'source_ip': client_ip,
+        connection_event = Event('connection', client_ip, extra={
             'source_port': client_addr[1],
             'destination_port': self.port,
             'protocol': 'ssh',
-            'connection_id': f"{client_ip}_{int(time.time())}"
-        }
+            'connection_id': f'{client_ip}_{_START}_{next(_SEQ):x}'
+        })
         self.log_event(connection_event)
         
+        disconnect_reason = 'auth_failed'
         try:
+            # Repeat offenders only get the banner, skipping the expensive key exchange
+            if self.is_known_scanner(client_ip):
+                disconnect_reason = 'known_scanner'
+                self.exchange_banner(client_socket, client_ip)
+                return
+            
             # Create SSH transport
             transport = paramiko.Transport(client_socket)
+            transport.local_version = SERVER_VERSION
             transport.add_server_key(self.server_key)
             
             # Create server interface
@@ -143,12 +418,10 @@ class SSHHoneypot:
                 pass
             
             # Log disconnection
-            disconnect_event = {
-                'event_type': 'disconnect',
-                'source_ip': client_ip,
+            disconnect_event = Event('disconnect', client_ip, extra={
                 'duration': 'unknown',
-                'reason': 'auth_failed'
-            }
+                'reason': disconnect_reason
+            })
             self.log_event(disconnect_event)
 
     def start(self):
@@ -158,35 +431,41 @@ class SSHHoneypot:
         # Create socket
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            # Allow multiple worker processes to share the port
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        
+        # Bounded worker pool, accept blocks while every worker is busy
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ssh_client')
+        worker_slots = threading.BoundedSemaphore(self.max_workers)
         
         try:
             server_socket.bind((self.host, self.port))
-            server_socket.listen(100)
+            server_socket.listen(1024)
             
             logger.info(f"SSH honeypot listening on {self.host}:{self.port}")
             
             while True:
+                worker_slots.acquire()
                 try:
                     client_socket, client_addr = server_socket.accept()
                     
-                    # Handle client in separate thread
-                    client_thread = threading.Thread(
-                        target=self.handle_client,
-                        args=(client_socket, client_addr)
-                    )
-                    client_thread.daemon = True
-                    client_thread.start()
+                    # Handle client on the worker pool
+                    future = executor.submit(self.handle_client, client_socket, client_addr)
+                    future.add_done_callback(lambda _: worker_slots.release())
                     
                 except KeyboardInterrupt:
                     logger.info("Shutting down SSH honeypot...")
                     break
                 except Exception as e:
+                    worker_slots.release()
                     logger.error(f"Error accepting connection: {e}")
                     
         except Exception as e:
             logger.error(f"Failed to start SSH honeypot: {e}")
         finally:
             server_socket.close()
+            executor.shutdown(wait=False, cancel_futures=True)
 
 class SSHServerInterface(paramiko.ServerInterface):
     def __init__(self, honeypot, client_ip):
@@ -207,15 +486,11 @@ class SSHServerInterface(paramiko.ServerInterface):
 
     def check_auth_publickey(self, username, key):
         # Log public key attempt
-        event_data = {
-            'event_type': 'pubkey_auth',
-            'source_ip': self.client_ip,
-            'username': username,
+        event = Event('pubkey_auth', self.client_ip, username=username, success=False, extra={
             'key_type': key.get_name(),
-            'key_fingerprint': key.get_fingerprint().hex(),
-            'success': False
-        }
-        self.honeypot.log_event(event_data)
+            'key_fingerprint': key.get_fingerprint().hex()
+        })
+        self.honeypot.log_event(event)
         
         return paramiko.AUTH_FAILED
 
@@ -230,9 +505,11 @@ def main():
     def print_stats():
         while True:
             time.sleep(300)  # Every 5 minutes
+            top_usernames = honeypot.stats['common_usernames'].most_common(5)
             logger.info(f"Stats: {honeypot.stats['total_connections']} connections, "
                        f"{honeypot.stats['auth_attempts']} auth attempts, "
-                       f"{len(honeypot.stats['unique_ips'])} unique IPs")
+                       f"~{int(honeypot.stats['unique_ips'].get_estimate())} unique IPs, "
+                       f"top usernames: {', '.join(username for username, _ in top_usernames)}")
     
     stats_thread = threading.Thread(target=print_stats)
     stats_thread.daemon = True
@@ -4,14 +4,19 @@ Telnet Honeypot Service
 Captures Telnet attacks and logs detailed information
 """
 
-import json
+import asyncio
+import functools
+import itertools
 import logging
+import multiprocessing
 import os
+import re
+import signal
 import socket
 import threading
 import time
-from datetime import datetime
-import requests
+import orjson
+from datasketches import frequent_items_error_type, frequent_strings_sketch, hll_sketch
 
 # Configure logging
 logging.basicConfig(
@@ -20,99 +25,337 @@ logging.basicConfig(
 )
 logger = logging.getLogger('telnet_honeypot')
 
+# Line terminators sent by telnet clients (CR LF, CR NUL, bare CR or LF)
+LINE_END = re.compile(rb'\r[\n\x00]?|\n')
+
+# Common IoT credentials
+IOT_CREDENTIALS = frozenset({
+    ('admin', 'admin'), ('root', 'root'), ('admin', 'password'),
+    ('root', 'password'), ('admin', '123456'), ('root', '123456'),
+    ('user', 'user'), ('guest', 'guest'), ('support', 'support'),
+    ('admin', ''), ('root', ''), ('', ''), ('admin', '1234'),
+    ('root', 'toor'), ('admin', 'pass')
+})
+
+# (attack_type, threat_level) per credential pair, anything else is plain brute force
+BRUTE_FORCE_CLASSIFICATION = ('brute_force', 'medium')
+LOGIN_CLASSIFICATION = dict.fromkeys(IOT_CREDENTIALS, ('iot_botnet', 'high'))
+
+# Canned responses for exact shell commands
+ROOT_LISTING = "\r\nbin  boot  dev  etc  home  lib  media  mnt  opt  proc  root  run  sbin  srv  sys  tmp  usr  var\r\n"
+COMMAND_RESPONSES = {
+    'ls': ROOT_LISTING,
+    'dir': ROOT_LISTING,
+    'pwd': "\r\n/home/user\r\n",
+    'whoami': "\r\nuser\r\n",
+    'id': "\r\nuid=1000(user) gid=1000(user) groups=1000(user)\r\n",
+    'ps': "\r\n  PID TTY          TIME CMD\r\n 1234 pts/0    00:00:00 bash\r\n",
+    'uname -a': "\r\nLinux honeypot 5.4.0-74-generic #83-Ubuntu SMP Sat May 8 02:35:39 UTC 2021 x86_64 x86_64 x86_64 GNU/Linux\r\n",
+    'exit': "\r\nlogout\r\n",
+    'quit': "\r\nlogout\r\n",
+    'logout': "\r\nlogout\r\n"
+}
+
+class TopK:
+    """Bounded heavy-hitter counter backed by a frequent items sketch"""
+    
+    def __init__(self, k=1024, lg_max_map_size=10):
+        self.k = k
+        self.sketch = frequent_strings_sketch(lg_max_map_size)
+
+    def update(self, item):
+        """Count one occurrence of item"""
+        self.sketch.update(item)
+
+    def most_common(self, n=None):
+        """Return up to n (item, estimated_count) pairs, most frequent first"""
+        items = self.sketch.get_frequent_items(frequent_items_error_type.NO_FALSE_NEGATIVES)
+        return [(item, estimate) for item, estimate, _, _ in items[:n or self.k]]
+
+class InputBuffer:
+    """Unconsumed input carried between reads on one connection"""
+    
+    def __init__(self):
+        self.data = bytearray()
+        # Set when the last line ended in a bare CR at the end of the buffer, its LF or NUL may arrive next
+        self.pending_cr = False
+
+class LogstashTCPClient:
+    """Persistent TCP connection to the Logstash json_lines input"""
+    
+    def __init__(self, host, port, max_backoff=30.0):
+        self.host = host
+        self.port = port
+        self.max_backoff = max_backoff
+        self.backoff = 0.5
+        self.retry_at = 0.0
+        self.sock = None
+
+    def connect(self):
+        """Open the connection to Logstash"""
+        sock = socket.create_connection((self.host, self.port), timeout=3)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # Leave Nagle on, writes are already coalesced into large buffers
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 0)
+        self.sock = sock
+        self.backoff = 0.5
+
+    def close(self):
+        """Close the connection and schedule a reconnect"""
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+        
+        # Exponential backoff between reconnect attempts
+        self.retry_at = time.monotonic() + self.backoff
+        self.backoff = min(self.backoff * 2, self.max_backoff)
+
+    def write(self, data):
+        """Send newline-delimited JSON, reconnecting when needed"""
+        if self.sock is None:
+            if time.monotonic() < self.retry_at:
+                return False
+            try:
+                self.connect()
+            except OSError as e:
+                logger.error("Failed to connect to Logstash: %s", e)
+                self.close()
+                return False
+        
+        try:
+            self.sock.sendall(data)
+            return True
+        except OSError as e:
+            logger.error("Failed to send to Logstash: %s", e)
+            self.close()
+            return False
+
+class RingBuffer:
+    """Bounded ring buffer that overwrites the oldest entry when full"""
+    
+    def __init__(self, capacity=8192):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.not_empty = threading.Event()
+
+    def push(self, item):
+        """Store item without ever blocking the producer"""
+        with self.lock:
+            if self.head - self.tail >= self.capacity:
+                # Full, drop the oldest entry
+                self.tail += 1
+                self.dropped += 1
+            self.slots[self.head % self.capacity] = item
+            self.head += 1
+        self.not_empty.set()
+
+    def drain(self, max_items):
+        """Remove and return up to max_items entries, oldest first"""
+        with self.lock:
+            count = min(self.head - self.tail, max_items)
+            items = []
+            for _ in range(count):
+                index = self.tail % self.capacity
+                items.append(self.slots[index])
+                self.slots[index] = None
+                self.tail += 1
+            if self.head == self.tail:
+                self.not_empty.clear()
+        return items
+
+    def wait(self, timeout=None):
+        """Wait until at least one entry is available"""
+        return self.not_empty.wait(timeout)
+
+class LogShipper:
+    """Ships honeypot events to file and Logstash from a background thread"""
+    
+    def __init__(self, log_file, logstash_host, logstash_port, flush_bytes=16384, flush_interval=0.1, capacity=8192, drain_size=256):
+        self.log_file = log_file
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.drain_size = drain_size
+        self.events = RingBuffer(capacity)
+        self.client = LogstashTCPClient(logstash_host, logstash_port)
+        
+        # Log file stays open in the shipper thread, reopened on SIGHUP for rotation
+        self.log_handle = None
+        self.reopen_requested = False
+        try:
+            signal.signal(signal.SIGHUP, self.request_reopen)
+        except ValueError:
+            # Signal handlers can only be installed from the main thread
+            pass
+        
+        # Start shipper thread
+        shipper_thread = threading.Thread(target=self.run, name='log_shipper')
+        shipper_thread.daemon = True
+        shipper_thread.start()
+
+    def enqueue(self, event_data):
+        """Queue event for shipping without blocking the caller"""
+        self.events.push(event_data)
+
+    def next_batch(self):
+        """Buffer events as JSON lines until flush_bytes or flush_interval is reached"""
+        buffer = bytearray()
+        self.events.wait()
+        deadline = time.monotonic() + self.flush_interval
+        
+        while True:
+            for event in self.events.drain(self.drain_size):
+                buffer += orjson.dumps(event, option=orjson.OPT_APPEND_NEWLINE)
+            
+            remaining = deadline - time.monotonic()
+            if len(buffer) >= self.flush_bytes or remaining <= 0:
+                break
+            self.events.wait(remaining)
+        
+        return buffer
+
+    def request_reopen(self, signum, frame):
+        """Ask the shipper thread to reopen the log file"""
+        self.reopen_requested = True
+
+    def close_log(self):
+        """Close the log file handle"""
+        if self.log_handle is not None:
+            try:
+                self.log_handle.close()
+            except OSError:
+                pass
+            self.log_handle = None
+
+    def write_batch(self, batch):
+        """Append batch to the local log file, flushing once per batch"""
+        if self.reopen_requested:
+            self.reopen_requested = False
+            self.close_log()
+        
+        try:
+            if self.log_handle is None:
+                self.log_handle = open(self.log_file, 'ab', buffering=1 << 16)
+            self.log_handle.write(batch)
+            self.log_handle.flush()
+        except Exception as e:
+            logger.error("Failed to write to log file: %s", e)
+            self.close_log()
+
+    def run(self):
+        """Drain the queue and ship events in batches"""
+        while True:
+            batch = self.next_batch()
+            if batch:
+                self.write_batch(batch)
+                self.client.write(batch)
+
 class TelnetHoneypot:
     def __init__(self, host='0.0.0.0', port=23):
         self.host = host
         self.port = port
         self.logstash_host = os.getenv('LOGSTASH_HOST', 'logstash')
         self.logstash_port = int(os.getenv('LOGSTASH_PORT', '5044'))
+        self.logstash_tcp_port = int(os.getenv('LOGSTASH_TCP_PORT', '5000'))
+        
+        # Start stamp, pid and counter for session ids, unique across worker processes
+        self.session_prefix = f'{int(time.time()):x}_{os.getpid():x}'
+        self.session_seq = itertools.count()
+        
+        # Background log shipper
+        self.shipper = LogShipper(
+            '/var/log/honeypot/telnet.log',
+            self.logstash_host,
+            self.logstash_tcp_port
+        )
         
         # Statistics
         self.stats = {
             'total_connections': 0,
             'login_attempts': 0,
-            'unique_ips': set(),
-            'common_usernames': {},
-            'common_passwords': {},
-            'commands_executed': {}
+            'unique_ips': hll_sketch(12),
+            'common_usernames': TopK(),
+            'common_passwords': TopK(),
+            'commands_executed': TopK()
         }
 
     def log_event(self, event_data):
-        """Log event to file and send to Logstash"""
+        """Queue event for the log shipper"""
         # Add timestamp and service info
         event_data.update({
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': time.time_ns() // 1_000_000,
             'service': 'telnet',
             'honeypot_type': 'telnet_honeypot',
             'version': '1.0.0'
         })
         
-        # Log to file
-        log_file = '/var/log/honeypot/telnet.log'
-        try:
-            with open(log_file, 'a') as f:
-                f.write(json.dumps(event_data) + '\n')
-        except Exception as e:
-            logger.error(f"Failed to write to log file: {e}")
-        
-        # Send to Logstash
-        try:
-            response = requests.post(
-                f'http://{self.logstash_host}:5000',
-                json=event_data,
-                timeout=5
-            )
-            if response.status_code != 200:
-                logger.warning(f"Failed to send to Logstash: {response.status_code}")
-        except Exception as e:
-            logger.error(f"Failed to send to Logstash: {e}")
+        self.shipper.enqueue(event_data)
 
-    def handle_client(self, client_socket, client_addr):
+    async def handle_client(self, reader, writer):
         """Handle individual client connection"""
-        client_ip = client_addr[0]
+        client_ip, client_port = writer.get_extra_info('peername')[:2]
+        
+        # Echo without Nagle delays, reap dead peers with keepalive, and keep the
+        # receive buffer small since attacker sessions only send short lines
+        client_socket = writer.get_extra_info('socket')
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 32768)
         self.stats['total_connections'] += 1
-        self.stats['unique_ips'].add(client_ip)
+        self.stats['unique_ips'].update(client_ip)
         
-        logger.info(f"Telnet connection from {client_ip}")
+        logger.info("Telnet connection from %s", client_ip)
+        
+        # One id per connection, shared by its connection and login events
+        session_id = f'{client_ip}_{self.session_prefix}_{next(self.session_seq):x}'
         
         # Log connection
         connection_event = {
             'event_type': 'connection',
             'source_ip': client_ip,
-            'source_port': client_addr[1],
+            'source_port': client_port,
             'destination_port': self.port,
             'protocol': 'telnet',
-            'connection_id': f"{client_ip}_{int(time.time())}"
+            'connection_id': session_id
         }
         self.log_event(connection_event)
         
+        # Unconsumed input carried between reads on this connection
+        rx_buffer = InputBuffer()
+        
         try:
             # Send welcome banner
             banner = b"Ubuntu 20.04.3 LTS\r\nlogin: "
-            client_socket.send(banner)
+            writer.write(banner)
             
             # Handle login process
-            username = self.get_input(client_socket, "login: ")
+            username = await self.get_input(reader, writer, rx_buffer, "login: ")
             if username:
-                client_socket.send(b"Password: ")
-                password = self.get_input(client_socket, "Password: ", hide=True)
+                writer.write(b"Password: ")
+                password = await self.get_input(reader, writer, rx_buffer, "Password: ", hide=True)
                 
                 if password:
                     # Log login attempt
-                    self.handle_login_attempt(client_ip, username, password)
+                    self.handle_login_attempt(client_ip, username, password, session_id)
                     
                     # Send login failed message
-                    client_socket.send(b"\r\nLogin incorrect\r\n")
-                    time.sleep(2)
+                    writer.write(b"\r\nLogin incorrect\r\n")
+                    await asyncio.sleep(2)
                     
                     # Simulate shell for IoT botnet detection
-                    self.simulate_shell(client_socket, client_ip, username)
+                    await self.simulate_shell(reader, writer, rx_buffer, client_ip, username)
             
         except Exception as e:
-            logger.error(f"Error handling client {client_ip}: {e}")
+            logger.error("Error handling client %s: %s", client_ip, e)
         finally:
             try:
-                client_socket.close()
+                writer.close()
             except:
                 pass
             
@@ -124,64 +367,76 @@ class TelnetHoneypot:
             }
             self.log_event(disconnect_event)
 
-    def get_input(self, client_socket, prompt, hide=False):
-        """Get input from client"""
+    async def get_input(self, reader, writer, rx_buffer, prompt, hide=False):
+        """Get a line of input from client, reading in chunks"""
         try:
-            client_socket.settimeout(30)  # 30 second timeout
-            data = b""
+            data = bytearray()
             
             while True:
-                chunk = client_socket.recv(1)
-                if not chunk:
-                    break
+                if not rx_buffer.data:
+                    chunk = await asyncio.wait_for(reader.read(4096), timeout=30)  # 30 second timeout
+                    if not chunk:
+                        break
+                    if rx_buffer.pending_cr and chunk[:1] in (b'\n', b'\x00'):
+                        # Drop the LF or NUL of a CR pair split across reads
+                        chunk = chunk[1:]
+                    rx_buffer.pending_cr = False
+                    rx_buffer.data += chunk
+                    if not rx_buffer.data:
+                        continue
                 
-                if chunk == b'\r' or chunk == b'\n':
-                    break
-                elif chunk == b'\x08' or chunk == b'\x7f':  # Backspace
-                    if data:
-                        data = data[:-1]
-                        if not hide:
-                            client_socket.send(b'\x08 \x08')
+                # Take input up to the first line terminator, keep the rest for the next call
+                match = LINE_END.search(rx_buffer.data)
+                if match:
+                    received = bytes(rx_buffer.data[:match.start()])
+                    bare_cr = rx_buffer.data[match.start():match.end()] == b'\r'
+                    del rx_buffer.data[:match.end()]
+                    rx_buffer.pending_cr = bare_cr and not rx_buffer.data
+                else:
+                    received = bytes(rx_buffer.data)
+                    rx_buffer.data.clear()
+                
+                # Echo everything received in this chunk with a single send
+                if b'\x08' not in received and b'\x7f' not in received:
+                    data += received
+                    echo = b'*' * len(received) if hide else received
                 else:
-                    data += chunk
-                    if not hide:
-                        client_socket.send(chunk)
-                    else:
-                        client_socket.send(b'*')
+                    echo = bytearray()
+                    for byte in received:
+                        if byte == 0x08 or byte == 0x7f:  # Backspace
+                            if data:
+                                del data[-1]
+                                if not hide:
+                                    echo += b'\x08 \x08'
+                        else:
+                            data.append(byte)
+                            echo += b'*' if hide else bytes((byte,))
+                if echo:
+                    writer.write(echo)
+                    await writer.drain()
+                
+                if match:
+                    break
             
             return data.decode('utf-8', errors='ignore').strip()
             
-        except socket.timeout:
+        except asyncio.TimeoutError:
             logger.warning("Client input timeout")
             return None
         except Exception as e:
-            logger.error(f"Error getting input: {e}")
+            logger.error("Error getting input: %s", e)
             return None
 
-    def handle_login_attempt(self, client_ip, username, password):
+    def handle_login_attempt(self, client_ip, username, password, session_id):
         """Handle login attempt"""
         self.stats['login_attempts'] += 1
-        self.stats['common_usernames'][username] = self.stats['common_usernames'].get(username, 0) + 1
-        self.stats['common_passwords'][password] = self.stats['common_passwords'].get(password, 0) + 1
+        self.stats['common_usernames'].update(username)
+        self.stats['common_passwords'].update(password)
         
-        logger.info(f"Telnet login attempt from {client_ip}: {username}:{password}")
+        logger.info("Telnet login attempt from %s: %s:%s", client_ip, username, password)
         
         # Detect IoT botnet patterns
-        attack_type = 'brute_force'
-        threat_level = 'medium'
-        
-        # Common IoT credentials
-        iot_credentials = [
-            ('admin', 'admin'), ('root', 'root'), ('admin', 'password'),
-            ('root', 'password'), ('admin', '123456'), ('root', '123456'),
-            ('user', 'user'), ('guest', 'guest'), ('support', 'support'),
-            ('admin', ''), ('root', ''), ('', ''), ('admin', '1234'),
-            ('root', 'toor'), ('admin', 'pass')
-        ]
-        
-        if (username, password) in iot_credentials:
-            attack_type = 'iot_botnet'
-            threat_level = 'high'
+        attack_type, threat_level = LOGIN_CLASSIFICATION.get((username, password), BRUTE_FORCE_CLASSIFICATION)
         
         # Log authentication attempt
         event_data = {
@@ -192,24 +447,25 @@ class TelnetHoneypot:
             'success': False,
             'attack_type': attack_type,
             'threat_level': threat_level,
-            'session_id': f"{client_ip}_{int(time.time())}"
+            'session_id': session_id
         }
         self.log_event(event_data)
 
-    def simulate_shell(self, client_socket, client_ip, username):
+    async def simulate_shell(self, reader, writer, rx_buffer, client_ip, username):
         """Simulate shell interaction to capture commands"""
         try:
             # Send fake shell prompt
             prompt = f"{username}@honeypot:~$ "
-            client_socket.send(prompt.encode())
+            prompt_bytes = prompt.encode()
+            writer.write(prompt_bytes)
             
             while True:
-                command = self.get_input(client_socket, prompt)
+                command = await self.get_input(reader, writer, rx_buffer, prompt)
                 if not command:
                     break
                 
                 # Log command
-                self.stats['commands_executed'][command] = self.stats['commands_executed'].get(command, 0) + 1
+                self.stats['commands_executed'].update(command)
                 
                 command_event = {
                     'event_type': 'command_execution',
@@ -220,91 +476,69 @@ class TelnetHoneypot:
                 }
                 self.log_event(command_event)
                 
-                logger.info(f"Command from {client_ip}: {command}")
+                logger.info("Command from %s: %s", client_ip, command)
                 
                 # Simulate command responses
-                response = self.simulate_command_response(command)
-                client_socket.send(response.encode())
-                client_socket.send(prompt.encode())
+                writer.write(self.simulate_command_response(command))
+                writer.write(prompt_bytes)
+                await writer.drain()
                 
                 # Break after a few commands to avoid long sessions
                 if len(command.split()) > 10:
                     break
                     
         except Exception as e:
-            logger.error(f"Error in shell simulation: {e}")
+            logger.error("Error in shell simulation: %s", e)
 
-    def simulate_command_response(self, command):
-        """Simulate command responses"""
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def simulate_command_response(command):
+        """Simulate command responses, memoized as encoded bytes"""
         cmd = command.lower().strip()
         
-        if cmd in ['ls', 'dir']:
-            return "\r\nbin  boot  dev  etc  home  lib  media  mnt  opt  proc  root  run  sbin  srv  sys  tmp  usr  var\r\n"
-        elif cmd == 'pwd':
-            return "\r\n/home/user\r\n"
-        elif cmd == 'whoami':
-            return "\r\nuser\r\n"
-        elif cmd == 'id':
-            return "\r\nuid=1000(user) gid=1000(user) groups=1000(user)\r\n"
-        elif cmd.startswith('cat '):
-            return "\r\ncat: permission denied\r\n"
-        elif cmd == 'ps':
-            return "\r\n  PID TTY          TIME CMD\r\n 1234 pts/0    00:00:00 bash\r\n"
-        elif cmd == 'uname -a':
-            return "\r\nLinux honeypot 5.4.0-74-generic #83-Ubuntu SMP Sat May 8 02:35:39 UTC 2021 x86_64 x86_64 x86_64 GNU/Linux\r\n"
-        elif cmd in ['exit', 'quit', 'logout']:
-            return "\r\nlogout\r\n"
-        else:
-            return f"\r\n{cmd}: command not found\r\n"
+        response = COMMAND_RESPONSES.get(cmd)
+        if response is None:
+            if cmd.startswith('cat '):
+                response = "\r\ncat: permission denied\r\n"
+            else:
+                response = f"\r\n{cmd}: command not found\r\n"
+        
+        return response.encode()
+
+    async def serve(self):
+        """Accept connections on the event loop"""
+        # SO_REUSEPORT lets every worker process bind its own listener on the port
+        server = await asyncio.start_server(self.handle_client, self.host, self.port, backlog=512, reuse_port=True)
+        logger.info("Telnet honeypot listening on %s:%s", self.host, self.port)
+        
+        async with server:
+            await server.serve_forever()
 
     def start(self):
         """Start the Telnet honeypot server"""
-        logger.info(f"Starting Telnet honeypot on {self.host}:{self.port}")
-        
-        # Create socket
-        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        logger.info("Starting Telnet honeypot on %s:%s", self.host, self.port)
         
         try:
-            server_socket.bind((self.host, self.port))
-            server_socket.listen(100)
-            
-            logger.info(f"Telnet honeypot listening on {self.host}:{self.port}")
-            
-            while True:
-                try:
-                    client_socket, client_addr = server_socket.accept()
-                    
-                    # Handle client in separate thread
-                    client_thread = threading.Thread(
-                        target=self.handle_client,
-                        args=(client_socket, client_addr)
-                    )
-                    client_thread.daemon = True
-                    client_thread.start()
-                    
-                except KeyboardInterrupt:
-                    logger.info("Shutting down Telnet honeypot...")
-                    break
-                except Exception as e:
-                    logger.error(f"Error accepting connection: {e}")
-                    
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            logger.info("Shutting down Telnet honeypot...")
         except Exception as e:
-            logger.error(f"Failed to start Telnet honeypot: {e}")
-        finally:
-            server_socket.close()
+            logger.error("Failed to start Telnet honeypot: %s", e)
 
-def main():
-    """Main function"""
+def run_worker():
+    """Run one honeypot worker with its own listener, shipper and stats"""
     honeypot = TelnetHoneypot()
+    worker_name = multiprocessing.current_process().name
     
     # Start statistics thread
     def print_stats():
         while True:
             time.sleep(300)  # Every 5 minutes
-            logger.info(f"Stats: {honeypot.stats['total_connections']} connections, "
-                       f"{honeypot.stats['login_attempts']} login attempts, "
-                       f"{len(honeypot.stats['unique_ips'])} unique IPs")
+            logger.info("Stats (%s): %s connections, %s login attempts, ~%d unique IPs",
+                       worker_name,
+                       honeypot.stats['total_connections'],
+                       honeypot.stats['login_attempts'],
+                       honeypot.stats['unique_ips'].get_estimate())
     
     stats_thread = threading.Thread(target=print_stats)
     stats_thread.daemon = True
@@ -313,5 +547,39 @@ def main():
     # Start honeypot
     honeypot.start()
 
+def main():
+    """Main function"""
+    workers = int(os.getenv('TELNET_WORKERS', str(os.cpu_count() or 1)))
+    if workers <= 1:
+        run_worker()
+        return
+    
+    # One accept loop per worker, the kernel spreads new connections across the listeners
+    logger.info("Starting %s Telnet honeypot workers", workers)
+    processes = []
+    for index in range(workers):
+        process = multiprocessing.Process(target=run_worker, name=f'telnet_worker_{index}')
+        process.daemon = True
+        process.start()
+        processes.append(process)
+    
+    # Forward SIGHUP so every worker reopens its log file after rotation
+    def forward_sighup(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGHUP)
+    
+    signal.signal(signal.SIGHUP, forward_sighup)
+    
+    # Stop the workers along with the parent on docker stop
+    def stop_workers(signum, frame):
+        for process in processes:
+            process.terminate()
+    
+    signal.signal(signal.SIGTERM, stop_workers)
+    
+    for process in processes:
+        process.join()
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -7,11 +7,12 @@ Monitors honeypot logs and sends alerts for suspicious activity
 import os
 import logging
 import time
-import json
 import smtplib
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+import orjson
 import schedule
 import requests
 from elasticsearch import Elasticsearch
@@ -23,10 +24,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger('alert_service')
 
+# Color coding for severity
+SEVERITY_COLORS = {
+    'low': '#36a64f',      # Green
+    'medium': '#ff9500',   # Orange
+    'high': '#ff0000',     # Red
+    'critical': '#8b0000'  # Dark Red
+}
+
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
 class AlertService:
     def __init__(self):
         self.elasticsearch_host = os.getenv('ELASTICSEARCH_HOST', 'http://elasticsearch:9200')
-        self.es = Elasticsearch([self.elasticsearch_host])
+        # One pooled keep-alive client, gzip-compressed since aggregation responses are large
+        self.es = Elasticsearch(
+            [self.elasticsearch_host],
+            http_compress=True,
+            connections_per_node=4,
+            request_timeout=10,
+            retry_on_timeout=True,
+            max_retries=2
+        )
         
         # Email configuration
         self.smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
@@ -34,9 +53,11 @@ class AlertService:
         self.smtp_username = os.getenv('SMTP_USERNAME')
         self.smtp_password = os.getenv('SMTP_PASSWORD')
         self.alert_email = os.getenv('ALERT_EMAIL')
+        self.smtp = None
         
         # Slack configuration
         self.slack_webhook = os.getenv('SLACK_WEBHOOK_URL')
+        self.http = requests.Session()
         
         # Alert thresholds
         self.thresholds = {
@@ -46,34 +67,25 @@ class AlertService:
             'iot_botnet_activity': int(os.getenv('ALERT_THRESHOLD_IOT_BOTNET', '10'))
         }
         
-        # Track sent alerts to avoid spam
-        self.sent_alerts = {}
+        # Track sent alerts to avoid spam, oldest first since keys are only added once
+        self.sent_alerts = OrderedDict()
+        self.hour_bucket = datetime.utcnow().strftime('%Y%m%d%H')
+        
+        # Alert queries are constant, build the _msearch body once
+        self.alert_searches = self.build_alert_searches()
+        self.alert_msearch_body = []
+        for query, _ in self.alert_searches:
+            self.alert_msearch_body.append({"index": "honeypot-logs-*"})
+            self.alert_msearch_body.append(query)
 
-    def check_high_volume_attacks(self):
+    def check_high_volume_attacks(self, response):
         """Check for high volume of attacks"""
         try:
-            # Query for attacks in the last hour
-            query = {
-                "query": {
-                    "bool": {
-                        "must": [
-                            {"range": {"@timestamp": {"gte": "now-1h"}}},
-                            {"terms": {"event_type": ["login_attempt", "connection", "command_execution"]}}
-                        ]
-                    }
-                },
-                "aggs": {
-                    "attack_count": {
-                        "value_count": {"field": "event_type"}
-                    }
-                }
-            }
-            
-            response = self.es.search(index="honeypot-logs-*", body=query)
-            attack_count = response['aggregations']['attack_count']['value']
+            # Exact hit count, every matching event carries event_type
+            attack_count = response['hits']['total']['value']
             
             if attack_count > self.thresholds['high_volume_attacks']:
-                alert_key = f"high_volume_{datetime.now().strftime('%Y%m%d%H')}"
+                alert_key = f"high_volume_{self.hour_bucket}"
                 if alert_key not in self.sent_alerts:
                     self.send_alert(
                         "High Volume Attack Detected",
@@ -84,32 +96,15 @@ class AlertService:
                     self.sent_alerts[alert_key] = datetime.now()
             
         except Exception as e:
-            logger.error(f"Error checking high volume attacks: {e}")
+            logger.error("Error checking high volume attacks: %s", e)
 
-    def check_unique_ips(self):
+    def check_unique_ips(self, response):
         """Check for unusual number of unique IPs"""
         try:
-            query = {
-                "query": {
-                    "bool": {
-                        "must": [
-                            {"range": {"@timestamp": {"gte": "now-1h"}}},
-                            {"exists": {"field": "source_ip"}}
-                        ]
-                    }
-                },
-                "aggs": {
-                    "unique_ips": {
-                        "cardinality": {"field": "source_ip"}
-                    }
-                }
-            }
-            
-            response = self.es.search(index="honeypot-logs-*", body=query)
             unique_ip_count = response['aggregations']['unique_ips']['value']
             
             if unique_ip_count > self.thresholds['unique_ips_per_hour']:
-                alert_key = f"unique_ips_{datetime.now().strftime('%Y%m%d%H')}"
+                alert_key = f"unique_ips_{self.hour_bucket}"
                 if alert_key not in self.sent_alerts:
                     self.send_alert(
                         "Unusual IP Activity Detected",
@@ -120,38 +115,17 @@ class AlertService:
                     self.sent_alerts[alert_key] = datetime.now()
             
         except Exception as e:
-            logger.error(f"Error checking unique IPs: {e}")
+            logger.error("Error checking unique IPs: %s", e)
 
-    def check_brute_force_attacks(self):
+    def check_brute_force_attacks(self, response):
         """Check for brute force attacks from single IPs"""
         try:
-            query = {
-                "query": {
-                    "bool": {
-                        "must": [
-                            {"range": {"@timestamp": {"gte": "now-1h"}}},
-                            {"term": {"event_type": "login_attempt"}}
-                        ]
-                    }
-                },
-                "aggs": {
-                    "by_ip": {
-                        "terms": {
-                            "field": "source_ip",
-                            "size": 100
-                        }
-                    }
-                }
-            }
-            
-            response = self.es.search(index="honeypot-logs-*", body=query)
-            
             for bucket in response['aggregations']['by_ip']['buckets']:
                 ip = bucket['key']
                 attempt_count = bucket['doc_count']
                 
                 if attempt_count > self.thresholds['brute_force_attempts']:
-                    alert_key = f"brute_force_{ip}_{datetime.now().strftime('%Y%m%d%H')}"
+                    alert_key = f"brute_force_{ip}_{self.hour_bucket}"
                     if alert_key not in self.sent_alerts:
                         self.send_alert(
                             "Brute Force Attack Detected",
@@ -162,38 +136,15 @@ class AlertService:
                         self.sent_alerts[alert_key] = datetime.now()
             
         except Exception as e:
-            logger.error(f"Error checking brute force attacks: {e}")
+            logger.error("Error checking brute force attacks: %s", e)
 
-    def check_iot_botnet_activity(self):
+    def check_iot_botnet_activity(self, response):
         """Check for IoT botnet activity"""
         try:
-            query = {
-                "query": {
-                    "bool": {
-                        "must": [
-                            {"range": {"@timestamp": {"gte": "now-1h"}}},
-                            {"term": {"attack_type": "iot_botnet"}}
-                        ]
-                    }
-                },
-                "aggs": {
-                    "iot_count": {
-                        "value_count": {"field": "event_type"}
-                    },
-                    "by_ip": {
-                        "terms": {
-                            "field": "source_ip",
-                            "size": 10
-                        }
-                    }
-                }
-            }
-            
-            response = self.es.search(index="honeypot-logs-*", body=query)
-            iot_count = response['aggregations']['iot_count']['value']
+            iot_count = response['hits']['total']['value']
             
             if iot_count > self.thresholds['iot_botnet_activity']:
-                alert_key = f"iot_botnet_{datetime.now().strftime('%Y%m%d%H')}"
+                alert_key = f"iot_botnet_{self.hour_bucket}"
                 if alert_key not in self.sent_alerts:
                     top_ips = [bucket['key'] for bucket in response['aggregations']['by_ip']['buckets'][:5]]
                     self.send_alert(
@@ -205,11 +156,95 @@ class AlertService:
                     self.sent_alerts[alert_key] = datetime.now()
             
         except Exception as e:
-            logger.error(f"Error checking IoT botnet activity: {e}")
+            logger.error("Error checking IoT botnet activity: %s", e)
+
+    def build_alert_searches(self):
+        """Return (query, handler) pairs for every alert check"""
+        # Attacks in the last hour
+        high_volume_query = {
+            "size": 0,
+            "track_total_hits": True,
+            "query": {
+                "bool": {
+                    "filter": [
+                        {"range": {"@timestamp": {"gte": "now-1h"}}},
+                        {"terms": {"event_type": ["login_attempt", "connection", "command_execution"]}}
+                    ]
+                }
+            }
+        }
+        
+        # Unique source IPs in the last hour
+        unique_ips_query = {
+            "size": 0,
+            "query": {
+                "bool": {
+                    "filter": [
+                        {"range": {"@timestamp": {"gte": "now-1h"}}},
+                        {"exists": {"field": "source_ip"}}
+                    ]
+                }
+            },
+            "aggs": {
+                "unique_ips": {
+                    "cardinality": {"field": "source_ip"}
+                }
+            }
+        }
+        
+        # Login attempts per IP in the last hour
+        brute_force_query = {
+            "size": 0,
+            "query": {
+                "bool": {
+                    "filter": [
+                        {"range": {"@timestamp": {"gte": "now-1h"}}},
+                        {"term": {"event_type": "login_attempt"}}
+                    ]
+                }
+            },
+            "aggs": {
+                "by_ip": {
+                    "terms": {
+                        "field": "source_ip",
+                        "size": 100
+                    }
+                }
+            }
+        }
+        
+        # IoT botnet attempts in the last hour
+        iot_botnet_query = {
+            "size": 0,
+            "track_total_hits": True,
+            "query": {
+                "bool": {
+                    "filter": [
+                        {"range": {"@timestamp": {"gte": "now-1h"}}},
+                        {"term": {"attack_type": "iot_botnet"}}
+                    ]
+                }
+            },
+            "aggs": {
+                "by_ip": {
+                    "terms": {
+                        "field": "source_ip",
+                        "size": 10
+                    }
+                }
+            }
+        }
+        
+        return [
+            (high_volume_query, self.check_high_volume_attacks),
+            (unique_ips_query, self.check_unique_ips),
+            (brute_force_query, self.check_brute_force_attacks),
+            (iot_botnet_query, self.check_iot_botnet_activity)
+        ]
 
     def send_alert(self, subject, message, severity, metadata=None):
         """Send alert via email and Slack"""
-        logger.warning(f"ALERT [{severity.upper()}]: {subject} - {message}")
+        logger.warning("ALERT [%s]: %s - %s", severity.upper(), subject, message)
         
         # Send email alert
         if self.alert_email and self.smtp_username and self.smtp_password:
@@ -239,7 +274,7 @@ Message:
 {message}
 
 Metadata:
-{json.dumps(metadata, indent=2) if metadata else 'None'}
+{orjson.dumps(metadata, option=orjson.OPT_INDENT_2).decode() if metadata else 'None'}
 
 ---
 Honeypot Alert System
@@ -247,33 +282,57 @@ Honeypot Alert System
             
             msg.attach(MIMEText(body, 'plain'))
             
-            # Send email
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()
-            server.login(self.smtp_username, self.smtp_password)
-            server.send_message(msg)
-            server.quit()
+            # Send email over the persistent connection, reconnecting once if the server dropped it
+            try:
+                self.smtp_connection().send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                self.close_smtp()
+                self.smtp_connection().send_message(msg)
             
-            logger.info(f"Email alert sent to {self.alert_email}")
+            logger.info("Email alert sent to %s", self.alert_email)
             
         except Exception as e:
-            logger.error(f"Failed to send email alert: {e}")
+            logger.error("Failed to send email alert: %s", e)
+
+    def smtp_connection(self):
+        """Return the authenticated SMTP connection, opening it if needed"""
+        if self.smtp is None:
+            server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=30)
+            try:
+                server.starttls()
+                server.login(self.smtp_username, self.smtp_password)
+            except Exception:
+                server.close()
+                raise
+            self.smtp = server
+        return self.smtp
+
+    def close_smtp(self):
+        """Drop the SMTP connection"""
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                self.smtp.close()
+            self.smtp = None
+
+    def smtp_keepalive(self):
+        """Send NOOP so idle timeouts do not drop the SMTP connection"""
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.noop()
+        except (smtplib.SMTPException, OSError):
+            # Reconnect lazily on the next alert
+            self.close_smtp()
 
     def send_slack_alert(self, subject, message, severity, metadata):
         """Send Slack alert"""
         try:
-            # Color coding for severity
-            colors = {
-                'low': '#36a64f',      # Green
-                'medium': '#ff9500',   # Orange
-                'high': '#ff0000',     # Red
-                'critical': '#8b0000'  # Dark Red
-            }
-            
             payload = {
                 "attachments": [
                     {
-                        "color": colors.get(severity, '#36a64f'),
+                        "color": SEVERITY_COLORS.get(severity, '#36a64f'),
                         "title": f"Honeypot Alert - {severity.upper()}",
                         "text": subject,
                         "fields": [
@@ -300,46 +359,55 @@ Honeypot Alert System
             if metadata:
                 payload["attachments"][0]["fields"].append({
                     "title": "Metadata",
-                    "value": f"```{json.dumps(metadata, indent=2)}```",
+                    "value": f"```{orjson.dumps(metadata, option=orjson.OPT_INDENT_2).decode()}```",
                     "short": False
                 })
             
-            response = requests.post(self.slack_webhook, json=payload)
+            # Serialize straight to bytes and reuse the webhook connection
+            response = self.http.post(self.slack_webhook, data=orjson.dumps(payload), headers=JSON_HEADERS, timeout=10)
             response.raise_for_status()
             
             logger.info("Slack alert sent successfully")
             
         except Exception as e:
-            logger.error(f"Failed to send Slack alert: {e}")
+            logger.error("Failed to send Slack alert: %s", e)
 
     def cleanup_old_alerts(self):
         """Clean up old alert tracking data"""
         cutoff_time = datetime.now() - timedelta(hours=24)
         
-        keys_to_remove = []
-        for key, timestamp in self.sent_alerts.items():
-            if timestamp < cutoff_time:
-                keys_to_remove.append(key)
-        
-        for key in keys_to_remove:
-            del self.sent_alerts[key]
+        # Expired records form a prefix, stop at the first one still in the window
+        removed = 0
+        while self.sent_alerts:
+            key, timestamp = next(iter(self.sent_alerts.items()))
+            if timestamp >= cutoff_time:
+                break
+            self.sent_alerts.popitem(last=False)
+            removed += 1
         
-        logger.info(f"Cleaned up {len(keys_to_remove)} old alert records")
+        logger.info("Cleaned up %s old alert records", removed)
 
     def run_checks(self):
         """Run all alert checks"""
         logger.info("Running alert checks...")
         
+        # UTC hour used in alert keys, computed once per run to match @timestamp
+        self.hour_bucket = datetime.utcnow().strftime('%Y%m%d%H')
+        
         try:
-            self.check_high_volume_attacks()
-            self.check_unique_ips()
-            self.check_brute_force_attacks()
-            self.check_iot_botnet_activity()
+            # Run every check query in a single _msearch round-trip
+            results = self.es.msearch(body=self.alert_msearch_body)
+            
+            for (_, check), response in zip(self.alert_searches, results['responses']):
+                if 'error' in response:
+                    logger.error("Alert query for %s failed: %s", check.__name__, response['error'])
+                    continue
+                check(response)
             
             logger.info("Alert checks completed")
             
         except Exception as e:
-            logger.error(f"Error during alert checks: {e}")
+            logger.error("Error during alert checks: %s", e)
 
     def run(self):
         """Run the alert service"""
@@ -351,6 +419,9 @@ Honeypot Alert System
         # Schedule cleanup every hour
         schedule.every().hour.do(self.cleanup_old_alerts)
         
+        # Keep the SMTP connection alive between alerts
+        schedule.every(4).minutes.do(self.smtp_keepalive)
+        
         logger.info("Alert service started. Scheduling checks...")
         
         # Run initial check
@@ -364,7 +435,7 @@ Honeypot Alert System
                 logger.info("Shutting down alert service...")
                 break
             except Exception as e:
-                logger.error(f"Error in main loop: {e}")
+                logger.error("Error in main loop: %s", e)
                 time.sleep(60)
 
 def main():
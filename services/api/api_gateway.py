@@ -5,11 +5,21 @@ Provides REST API for honeypot data and statistics
 """
 
 import os
+import base64
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from flask import Flask, jsonify, request
+from functools import wraps
+from cachetools import TTLCache
+from flask import Flask, Response, jsonify, request
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
-from elasticsearch import Elasticsearch
+from flask_compress import Compress
+from elasticsearch import Elasticsearch, NotFoundError
+from elasticsearch.serializer import JsonSerializer
+import orjson
 
 # Configure logging
 logging.basicConfig(
@@ -18,13 +28,175 @@ logging.basicConfig(
 )
 logger = logging.getLogger('api_gateway')
 
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson, so jsonify builds response bytes directly"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS),
+            mimetype='application/json'
+        )
+
 # Create Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)
 
+# Compress JSON responses, small bodies are not worth the CPU
+app.config['COMPRESS_MIMETYPES'] = ['application/json']
+app.config['COMPRESS_MIN_SIZE'] = 1024
+Compress(app)
+
+class OrjsonSerializer(JsonSerializer):
+    """Elasticsearch JSON serializer backed by orjson"""
+    
+    def dumps(self, data):
+        # Pre-serialized bodies pass through unchanged
+        if isinstance(data, (str, bytes)):
+            return super().dumps(data)
+        return orjson.dumps(data, default=self.default)
+    
+    def loads(self, data):
+        return orjson.loads(data)
+
 # Initialize Elasticsearch
 elasticsearch_host = os.getenv('ELASTICSEARCH_HOST', 'http://elasticsearch:9200')
-es = Elasticsearch([elasticsearch_host])
+es = Elasticsearch(
+    [elasticsearch_host],
+    # Keep-alive pool sized for concurrent requests within a worker
+    connections_per_node=int(os.getenv('ES_POOL_MAXSIZE', '32')),
+    http_compress=True,
+    request_timeout=10,
+    retry_on_timeout=True,
+    max_retries=3,
+    serializer=OrjsonSerializer()
+)
+
+# Static parts of the stats queries, built once and shared by every request.
+# Handlers only build the time filter and variable sizes around them and must not mutate these
+OVERVIEW_AGGS = {
+    "unique_ips": {
+        "cardinality": {"field": "source_ip"}
+    },
+    "by_service": {
+        "terms": {"field": "service", "size": 10}
+    },
+    "by_attack_type": {
+        "terms": {"field": "attack_type", "size": 10}
+    }
+}
+
+TIMELINE_SERVICE_AGGS = {
+    "by_service": {
+        "terms": {"field": "service", "size": 10}
+    }
+}
+
+TOP_IP_AGGS = {
+    "by_service": {
+        "terms": {"field": "service", "size": 5}
+    },
+    "by_attack_type": {
+        "terms": {"field": "attack_type", "size": 5}
+    },
+    # Single-bucket terms return just the strings, no _source fetch per IP
+    "country": {
+        "terms": {"field": "geoip.country_name", "size": 1}
+    },
+    "city": {
+        "terms": {"field": "geoip.city_name", "size": 1}
+    },
+    "as_org": {
+        "terms": {"field": "geoip_asn.as_org", "size": 1}
+    }
+}
+
+COUNTRY_AGGS = {
+    "unique_ips": {
+        "cardinality": {"field": "source_ip"}
+    }
+}
+
+SOURCE_IP_EXISTS = {"exists": {"field": "source_ip"}}
+COUNTRY_EXISTS = {"exists": {"field": "geoip.country_name"}}
+
+# Bulky fields left out of log search hits unless explicitly requested via ?fields=
+# event.original and message duplicate the whole event, form_data carries HTTP request bodies
+DEFAULT_SOURCE_EXCLUDES = {"excludes": ["event.original", "message", "form_data"]}
+
+# Log search pages through a point-in-time snapshot, kept open this long between page requests
+PIT_KEEP_ALIVE = '1m'
+
+# Runs independent ES calls of one request concurrently, so latency is the slowest call not the sum
+es_executor = ThreadPoolExecutor(max_workers=int(os.getenv('ES_EXECUTOR_WORKERS', '8')))
+
+# Short-lived cache for dashboard polling of the stats endpoints
+response_cache = TTLCache(
+    maxsize=int(os.getenv('RESPONSE_CACHE_SIZE', '512')),
+    ttl=int(os.getenv('RESPONSE_CACHE_TTL', '30'))
+)
+response_cache_lock = threading.Lock()
+
+# Cache misses currently being computed, concurrent identical requests wait on the first one
+inflight_requests = {}
+
+def cached_response(view):
+    """Serve repeated requests with identical query params from the response cache"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = (request.path, tuple(sorted(request.args.items())))
+        with response_cache_lock:
+            cached = response_cache.get(key)
+            if cached is None:
+                inflight = inflight_requests.get(key)
+                leader = inflight is None
+                if leader:
+                    inflight = inflight_requests[key] = threading.Event()
+        if cached is not None:
+            return Response(cached, mimetype='application/json')
+        
+        if not leader:
+            # Another thread is already querying ES for this key, reuse its result
+            inflight.wait(timeout=60)
+            with response_cache_lock:
+                cached = response_cache.get(key)
+            if cached is not None:
+                return Response(cached, mimetype='application/json')
+            # The first request failed, query ES ourselves so the error is reported per request
+            return view(*args, **kwargs)
+        
+        try:
+            response = app.make_response(view(*args, **kwargs))
+            # Only successful responses are cached, errors are retried on the next request
+            if response.status_code == 200:
+                with response_cache_lock:
+                    response_cache[key] = response.get_data()
+            return response
+        finally:
+            with response_cache_lock:
+                inflight_requests.pop(key, None)
+            inflight.set()
+    return wrapper
+
+# Last formatted response timestamp as (epoch second, ISO string), swapped as one tuple so threads never see a torn pair
+timestamp_cache = (0, '')
+
+def utc_timestamp():
+    """Return the current UTC time as an ISO string, formatted at most once per second"""
+    global timestamp_cache
+    now = int(time.time())
+    cached_second, cached_iso = timestamp_cache
+    if now != cached_second:
+        cached_iso = datetime.utcfromtimestamp(now).isoformat()
+        timestamp_cache = (now, cached_iso)
+    return cached_iso
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -34,7 +206,7 @@ def health_check():
         es.ping()
         return jsonify({
             'status': 'healthy',
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': utc_timestamp(),
             'service': 'api_gateway'
         })
     except Exception as e:
@@ -42,78 +214,42 @@ def health_check():
         return jsonify({
             'status': 'unhealthy',
             'error': str(e),
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': utc_timestamp(),
             'service': 'api_gateway'
         }), 500
 
 @app.route('/api/stats/overview', methods=['GET'])
+@cached_response
 def get_overview_stats():
     """Get overview statistics"""
     try:
         # Get time range from query params
         hours = int(request.args.get('hours', 24))
-        time_range = f"now-{hours}h"
-        
-        # Total events
-        total_query = {
-            "query": {
-                "range": {"@timestamp": {"gte": time_range}}
-            }
-        }
-        total_response = es.count(index="honeypot-logs-*", body=total_query)
-        total_events = total_response['count']
+        # Rounded to the minute so ES can reuse the cached range filter
+        time_range = f"now-{hours}h/m"
         
-        # Unique IPs
-        unique_ips_query = {
+        # Total events, unique IPs, events by service and attack types in one search.
+        # cardinality and terms skip documents missing the field, so no exists filters are needed
+        query = {
+            "size": 0,
+            "track_total_hits": True,
             "query": {
                 "bool": {
-                    "must": [
-                        {"range": {"@timestamp": {"gte": time_range}}},
-                        {"exists": {"field": "source_ip"}}
+                    # Filter context skips scoring and lets ES cache the range bitset
+                    "filter": [
+                        {"range": {"@timestamp": {"gte": time_range}}}
                     ]
                 }
             },
-            "aggs": {
-                "unique_ips": {
-                    "cardinality": {"field": "source_ip"}
-                }
-            }
+            "aggs": OVERVIEW_AGGS
         }
-        unique_ips_response = es.search(index="honeypot-logs-*", body=unique_ips_query)
-        unique_ips = unique_ips_response['aggregations']['unique_ips']['value']
+        response = es.search(index="honeypot-logs-*", body=query)
+        aggregations = response['aggregations']
         
-        # Events by service
-        services_query = {
-            "query": {
-                "range": {"@timestamp": {"gte": time_range}}
-            },
-            "aggs": {
-                "by_service": {
-                    "terms": {"field": "service", "size": 10}
-                }
-            }
-        }
-        services_response = es.search(index="honeypot-logs-*", body=services_query)
-        services = {bucket['key']: bucket['doc_count'] for bucket in services_response['aggregations']['by_service']['buckets']}
-        
-        # Attack types
-        attacks_query = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {"range": {"@timestamp": {"gte": time_range}}},
-                        {"exists": {"field": "attack_type"}}
-                    ]
-                }
-            },
-            "aggs": {
-                "by_attack_type": {
-                    "terms": {"field": "attack_type", "size": 10}
-                }
-            }
-        }
-        attacks_response = es.search(index="honeypot-logs-*", body=attacks_query)
-        attack_types = {bucket['key']: bucket['doc_count'] for bucket in attacks_response['aggregations']['by_attack_type']['buckets']}
+        total_events = response['hits']['total']['value']
+        unique_ips = aggregations['unique_ips']['value']
+        services = {bucket['key']: bucket['doc_count'] for bucket in aggregations['by_service']['buckets']}
+        attack_types = {bucket['key']: bucket['doc_count'] for bucket in aggregations['by_attack_type']['buckets']}
         
         return jsonify({
             'timeframe': f"{hours} hours",
@@ -121,7 +257,7 @@ def get_overview_stats():
             'unique_ips': unique_ips,
             'services': services,
             'attack_types': attack_types,
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': utc_timestamp()
         })
         
     except Exception as e:
@@ -129,17 +265,24 @@ def get_overview_stats():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/stats/timeline', methods=['GET'])
+@cached_response
 def get_timeline_stats():
     """Get timeline statistics"""
     try:
         # Get time range from query params
         hours = int(request.args.get('hours', 24))
         interval = request.args.get('interval', '1h')
-        time_range = f"now-{hours}h"
+        # Rounded to the minute so ES can reuse the cached range filter
+        time_range = f"now-{hours}h/m"
         
         query = {
             "query": {
-                "range": {"@timestamp": {"gte": time_range}}
+                "bool": {
+                    # Filter context skips scoring and lets ES cache the range bitset
+                    "filter": [
+                        {"range": {"@timestamp": {"gte": time_range}}}
+                    ]
+                }
             },
             "aggs": {
                 "timeline": {
@@ -148,11 +291,7 @@ def get_timeline_stats():
                         "fixed_interval": interval,
                         "min_doc_count": 0
                     },
-                    "aggs": {
-                        "by_service": {
-                            "terms": {"field": "service", "size": 10}
-                        }
-                    }
+                    "aggs": TIMELINE_SERVICE_AGGS
                 }
             }
         }
@@ -176,7 +315,7 @@ def get_timeline_stats():
             'timeframe': f"{hours} hours",
             'interval': interval,
             'timeline': timeline_data,
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': utc_timestamp()
         })
         
     except Exception as e:
@@ -184,20 +323,23 @@ def get_timeline_stats():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/stats/top-ips', methods=['GET'])
+@cached_response
 def get_top_ips():
     """Get top attacking IPs"""
     try:
         # Get time range from query params
         hours = int(request.args.get('hours', 24))
         limit = int(request.args.get('limit', 10))
-        time_range = f"now-{hours}h"
+        # Rounded to the minute so ES can reuse the cached range filter
+        time_range = f"now-{hours}h/m"
         
         query = {
+            "size": 0,
             "query": {
                 "bool": {
-                    "must": [
+                    "filter": [
                         {"range": {"@timestamp": {"gte": time_range}}},
-                        {"exists": {"field": "source_ip"}}
+                        SOURCE_IP_EXISTS
                     ]
                 }
             },
@@ -207,20 +349,7 @@ def get_top_ips():
                         "field": "source_ip",
                         "size": limit
                     },
-                    "aggs": {
-                        "by_service": {
-                            "terms": {"field": "service", "size": 5}
-                        },
-                        "by_attack_type": {
-                            "terms": {"field": "attack_type", "size": 5}
-                        },
-                        "geoip_info": {
-                            "top_hits": {
-                                "size": 1,
-                                "_source": ["geoip.country_name", "geoip.city_name", "geoip_asn.as_org"]
-                            }
-                        }
-                    }
+                    "aggs": TOP_IP_AGGS
                 }
             }
         }
@@ -240,15 +369,13 @@ def get_top_ips():
             
             # Get GeoIP info
             geoip_info = {}
-            if bucket['geoip_info']['hits']['hits']:
-                source = bucket['geoip_info']['hits']['hits'][0]['_source']
-                if 'geoip' in source:
-                    geoip_info = {
-                        'country': source['geoip'].get('country_name'),
-                        'city': source['geoip'].get('city_name')
-                    }
-                if 'geoip_asn' in source:
-                    geoip_info['as_org'] = source['geoip_asn'].get('as_org')
+            if bucket['country']['buckets'] or bucket['city']['buckets']:
+                geoip_info = {
+                    'country': bucket['country']['buckets'][0]['key'] if bucket['country']['buckets'] else None,
+                    'city': bucket['city']['buckets'][0]['key'] if bucket['city']['buckets'] else None
+                }
+            if bucket['as_org']['buckets']:
+                geoip_info['as_org'] = bucket['as_org']['buckets'][0]['key']
             
             top_ips.append({
                 'ip': ip,
@@ -261,7 +388,7 @@ def get_top_ips():
         return jsonify({
             'timeframe': f"{hours} hours",
             'top_ips': top_ips,
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': utc_timestamp()
         })
         
     except Exception as e:
@@ -269,51 +396,65 @@ def get_top_ips():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/stats/countries', methods=['GET'])
+@cached_response
 def get_country_stats():
     """Get attack statistics by country"""
     try:
         # Get time range from query params
         hours = int(request.args.get('hours', 24))
-        time_range = f"now-{hours}h"
+        size = int(request.args.get('size', 20))
+        after = request.args.get('after')
+        # Rounded to the minute so ES can reuse the cached range filter
+        time_range = f"now-{hours}h/m"
+        
+        # Composite buckets page through countries instead of clipping a terms agg on every shard
+        by_country = {
+            "size": size,
+            "sources": [
+                {"country": {"terms": {"field": "geoip.country_name"}}}
+            ]
+        }
+        if after:
+            by_country["after"] = {"country": after}
         
         query = {
+            "size": 0,
             "query": {
                 "bool": {
-                    "must": [
+                    "filter": [
                         {"range": {"@timestamp": {"gte": time_range}}},
-                        {"exists": {"field": "geoip.country_name"}}
+                        COUNTRY_EXISTS
                     ]
                 }
             },
             "aggs": {
                 "by_country": {
-                    "terms": {
-                        "field": "geoip.country_name",
-                        "size": 20
-                    },
-                    "aggs": {
-                        "unique_ips": {
-                            "cardinality": {"field": "source_ip"}
-                        }
-                    }
+                    "composite": by_country,
+                    "aggs": COUNTRY_AGGS
                 }
             }
         }
         
         response = es.search(index="honeypot-logs-*", body=query)
         
+        by_country = response['aggregations']['by_country']
+        
         countries = []
-        for bucket in response['aggregations']['by_country']['buckets']:
+        for bucket in by_country['buckets']:
             countries.append({
-                'country': bucket['key'],
+                'country': bucket['key']['country'],
                 'total_events': bucket['doc_count'],
                 'unique_ips': bucket['unique_ips']['value']
             })
         
+        # after_key is only returned while there may be more pages
+        next_after = by_country.get('after_key', {}).get('country') if len(countries) == size else None
+        
         return jsonify({
             'timeframe': f"{hours} hours",
             'countries': countries,
-            'timestamp': datetime.utcnow().isoformat()
+            'after': next_after,
+            'timestamp': utc_timestamp()
         })
         
     except Exception as e:
@@ -328,14 +469,17 @@ def search_logs():
         query_string = request.args.get('q', '*')
         hours = int(request.args.get('hours', 24))
         size = int(request.args.get('size', 100))
-        from_param = int(request.args.get('from', 0))
+        after = request.args.get('after')
         service = request.args.get('service')
         source_ip = request.args.get('source_ip')
+        fields = request.args.get('fields')
         
-        time_range = f"now-{hours}h"
+        # Rounded to the minute so ES can reuse the cached range filter
+        time_range = f"now-{hours}h/m"
         
-        # Build query
-        must_clauses = [
+        # Build query, exact matches go in filter context so they are cached and not scored
+        must_clauses = []
+        filter_clauses = [
             {"range": {"@timestamp": {"gte": time_range}}}
         ]
         
@@ -345,24 +489,60 @@ def search_logs():
             })
         
         if service:
-            must_clauses.append({"term": {"service": service}})
+            filter_clauses.append({"term": {"service": service}})
         
         if source_ip:
-            must_clauses.append({"term": {"source_ip": source_ip}})
+            filter_clauses.append({"term": {"source_ip": source_ip}})
+        
+        # Only fetch the requested fields, or everything but the bulky ones
+        if fields:
+            source_filter = [field.strip() for field in fields.split(',') if field.strip()]
+        else:
+            source_filter = DEFAULT_SOURCE_EXCLUDES
+        
+        # Cursor pagination over a point-in-time, so pages are cut from one snapshot while indexing
+        # and merges carry on. The cursor holds the PIT id and the sort values of the previous page's last hit
+        if after:
+            # Cursors come back from clients, so reject anything that is not one we handed out
+            try:
+                cursor = orjson.loads(base64.urlsafe_b64decode(after))
+            except (ValueError, TypeError):
+                cursor = None
+            if (not isinstance(cursor, dict) or not isinstance(cursor.get('pit'), str)
+                    or not isinstance(cursor.get('after'), list)):
+                return jsonify({'error': 'invalid cursor'}), 400
+            pit_id = cursor['pit']
+        else:
+            cursor = None
+            pit_id = es.open_point_in_time(index="honeypot-logs-*", keep_alive=PIT_KEEP_ALIVE)['id']
         
         query = {
             "query": {
-                "bool": {"must": must_clauses}
+                "bool": {"must": must_clauses, "filter": filter_clauses}
             },
-            "sort": [{"@timestamp": {"order": "desc"}}],
-            "from": from_param,
-            "size": size
+            # _shard_doc breaks ties between events logged in the same millisecond, it is unique within a PIT
+            "sort": [{"@timestamp": {"order": "desc"}}, {"_shard_doc": {"order": "desc"}}],
+            "size": size,
+            "_source": source_filter,
+            "pit": {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE}
         }
+        if cursor:
+            query["search_after"] = cursor['after']
         
-        response = es.search(index="honeypot-logs-*", body=query)
+        try:
+            response = es.search(body=query)
+        except NotFoundError:
+            if not cursor:
+                raise
+            # The PIT behind an old cursor has expired, the client has to start again from the first page
+            return jsonify({'error': 'cursor expired'}), 400
+        
+        # The PIT id can change between requests, always hand back the latest one
+        pit_id = response['pit_id']
+        hits = response['hits']['hits']
         
         logs = []
-        for hit in response['hits']['hits']:
+        for hit in hits:
             logs.append({
                 'id': hit['_id'],
                 'timestamp': hit['_source'].get('@timestamp'),
@@ -372,12 +552,20 @@ def search_logs():
                 'data': hit['_source']
             })
         
+        # A short page means there is nothing after it, release the PIT instead of waiting for it to expire
+        next_after = None
+        if len(hits) == size:
+            next_after = base64.urlsafe_b64encode(orjson.dumps({'pit': pit_id, 'after': hits[-1]['sort']})).decode()
+        else:
+            es.options(ignore_status=404).close_point_in_time(id=pit_id)
+        
         return jsonify({
             'total': response['hits']['total']['value'],
             'logs': logs,
+            'after': next_after,
             'query': query_string,
             'timeframe': f"{hours} hours",
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': utc_timestamp()
         })
         
     except Exception as e:
@@ -389,18 +577,27 @@ def get_system_status():
     """Get system status"""
     try:
         # Check Elasticsearch cluster health
-        cluster_health = es.cluster.health()
+        health_future = es_executor.submit(es.cluster.health)
+        
+        # Get index sizes from _cat/indices, only the two columns we sum instead of full per-shard stats
+        indices_future = es_executor.submit(
+            es.cat.indices,
+            index="honeypot-logs-*",
+            bytes='b',
+            h='store.size,docs.count',
+            format='json'
+        )
         
-        # Get index information
-        indices_stats = es.indices.stats(index="honeypot-logs-*")
+        cluster_health = health_future.result()
+        indices = indices_future.result()
         
-        # Calculate storage usage
+        # Calculate storage usage, closed indices report no values
         total_size = 0
         total_docs = 0
         
-        for index_name, index_stats in indices_stats['indices'].items():
-            total_size += index_stats['total']['store']['size_in_bytes']
-            total_docs += index_stats['total']['docs']['count']
+        for index_info in indices:
+            total_size += int(index_info.get('store.size') or 0)
+            total_docs += int(index_info.get('docs.count') or 0)
         
         return jsonify({
             'elasticsearch': {
@@ -413,7 +610,7 @@ def get_system_status():
                 'total_size_mb': round(total_size / 1024 / 1024, 2),
                 'total_documents': total_docs
             },
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': utc_timestamp()
         })
         
     except Exception as e:
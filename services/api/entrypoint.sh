@@ -2,4 +2,7 @@
 set -e
 
 echo "Starting API Gateway service..."
-exec gunicorn --bind 0.0.0.0:8080 --workers 2 --timeout 120 api_gateway:app
\ No newline at end of file
+# Threaded workers keep serving other requests while one waits on Elasticsearch
+exec gunicorn --bind 0.0.0.0:8080 --workers 2 \
+    --worker-class gthread --threads "${GUNICORN_THREADS:-16}" \
+    --timeout 120 api_gateway:app
\ No newline at end of file
@@ -5,15 +5,18 @@ Downloads and maintains MaxMind GeoIP databases
 """
 
 import os
+import ipaddress
 import logging
-import time
-import gzip
+import shutil
 import tarfile
 import requests
-import schedule
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from email.utils import parsedate_to_datetime
+from apscheduler.schedulers.blocking import BlockingScheduler
 import geoip2.database
 from elasticsearch import Elasticsearch
+from elasticsearch.helpers import parallel_bulk
 
 # Configure logging
 logging.basicConfig(
@@ -22,6 +25,17 @@ logging.basicConfig(
 )
 logger = logging.getLogger('geoip_service')
 
+# Parallel mmdb lookups per enrichment cycle, the readers are safe to share between threads
+LOOKUP_WORKERS = int(os.getenv('GEOIP_LOOKUP_WORKERS', '8'))
+LOOKUP_TIMEOUT = 60
+
+def is_global_ip(source_ip):
+    """Return True if the IP is public, private and malformed addresses never resolve in GeoLite2"""
+    try:
+        return ipaddress.ip_address(source_ip).is_global
+    except ValueError:
+        return False
+
 class GeoIPService:
     def __init__(self):
         self.account_id = os.getenv('MAXMIND_ACCOUNT_ID')
@@ -41,11 +55,24 @@ class GeoIPService:
             'GeoLite2-Country': 'GeoLite2-Country.mmdb',
             'GeoLite2-ASN': 'GeoLite2-ASN.mmdb'
         }
+        
+        # Open database readers, kept for the life of the process and reopened when the file changes
+        self.readers = {}
+        self.reader_mtimes = {}
+
+    def remote_last_modified(self, url, params):
+        """Return the Last-Modified time of a MaxMind download as a timestamp, or None"""
+        try:
+            response = requests.head(url, params=params, auth=(self.account_id, self.license_key),
+                                     allow_redirects=True, timeout=30)
+            response.raise_for_status()
+            return parsedate_to_datetime(response.headers['Last-Modified']).timestamp()
+        except Exception as e:
+            logger.debug(f"Could not get Last-Modified for {params['edition_id']}: {e}")
+            return None
 
     def download_database(self, edition_id):
         """Download GeoIP database from MaxMind"""
-        logger.info(f"Downloading {edition_id} database...")
-        
         url = f"https://download.maxmind.com/app/geoip_download"
         params = {
             'edition_id': edition_id,
@@ -53,34 +80,75 @@ class GeoIPService:
             'suffix': 'tar.gz'
         }
         
+        db_path = os.path.join(self.geoip_dir, self.databases[edition_id])
+        tmp_path = f"{db_path}.tmp"
+        
+        # Skip the download if the local file is at least as new as MaxMind's latest build
+        last_modified = self.remote_last_modified(url, params)
+        if last_modified and os.path.exists(db_path) and os.stat(db_path).st_mtime >= last_modified:
+            logger.info(f"{edition_id} is already up to date")
+            return True
+        
+        logger.info(f"Downloading {edition_id} database...")
+        
         try:
-            response = requests.get(url, params=params, auth=(self.account_id, self.license_key))
-            response.raise_for_status()
-            
-            # Save tar.gz file
-            tar_path = os.path.join(self.geoip_dir, f"{edition_id}.tar.gz")
-            with open(tar_path, 'wb') as f:
-                f.write(response.content)
-            
-            # Extract database file
-            with tarfile.open(tar_path, 'r:gz') as tar:
-                for member in tar.getmembers():
-                    if member.name.endswith('.mmdb'):
-                        # Extract to geoip directory with standard name
-                        member.name = self.databases[edition_id]
-                        tar.extract(member, self.geoip_dir)
-                        break
+            with requests.get(url, params=params, auth=(self.account_id, self.license_key), stream=True) as response:
+                response.raise_for_status()
+                response.raw.decode_content = True
+                
+                # Stream the archive straight from the response, the tar is read forward only
+                found = False
+                with tarfile.open(fileobj=response.raw, mode='r|gz') as tar:
+                    for member in tar:
+                        if member.isfile() and member.name.endswith('.mmdb'):
+                            # Write to a temp file and swap it in so readers never see a partial database
+                            with tar.extractfile(member) as src, open(tmp_path, 'wb') as dst:
+                                shutil.copyfileobj(src, dst, 1024 * 1024)
+                            os.replace(tmp_path, db_path)
+                            # Stamp the file with the build time so the next check compares like with like
+                            if last_modified:
+                                os.utime(db_path, (last_modified, last_modified))
+                            found = True
+                            break
             
-            # Clean up tar file
-            os.remove(tar_path)
+            if not found:
+                raise ValueError(f"No .mmdb file in {edition_id} archive")
             
             logger.info(f"Successfully downloaded and extracted {edition_id}")
             return True
             
         except Exception as e:
             logger.error(f"Failed to download {edition_id}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
             return False
 
+    def get_reader(self, edition_id):
+        """Return a cached reader for a database, reopening it if the file has changed"""
+        db_path = os.path.join(self.geoip_dir, self.databases[edition_id])
+        try:
+            mtime = os.stat(db_path).st_mtime
+        except FileNotFoundError:
+            return None
+        
+        reader = self.readers.get(edition_id)
+        if reader is not None and self.reader_mtimes.get(edition_id) == mtime:
+            return reader
+        
+        if reader is not None:
+            reader.close()
+        reader = geoip2.database.Reader(db_path)
+        self.readers[edition_id] = reader
+        self.reader_mtimes[edition_id] = mtime
+        return reader
+
+    def close_readers(self):
+        """Close all cached database readers"""
+        for reader in self.readers.values():
+            reader.close()
+        self.readers.clear()
+        self.reader_mtimes.clear()
+
     def update_databases(self):
         """Update all GeoIP databases"""
         logger.info("Starting GeoIP database update...")
@@ -157,6 +225,43 @@ class GeoIPService:
             except Exception as e:
                 logger.error(f"Error testing {edition_id}: {e}")
 
+    def lookup_ip(self, source_ip, city_db, asn_db):
+        """Look up GeoIP and ASN data for a single IP"""
+        geoip_data = {}
+        
+        # Get city/country data
+        if city_db:
+            try:
+                city_response = city_db.city(source_ip)
+                geoip_data.update({
+                    'geoip': {
+                        'country_name': city_response.country.name,
+                        'country_code': city_response.country.iso_code,
+                        'city_name': city_response.city.name,
+                        'continent_code': city_response.continent.code,
+                        'latitude': float(city_response.location.latitude) if city_response.location.latitude else None,
+                        'longitude': float(city_response.location.longitude) if city_response.location.longitude else None,
+                        'timezone': city_response.location.time_zone
+                    }
+                })
+            except Exception as e:
+                logger.debug(f"City lookup failed for {source_ip}: {e}")
+        
+        # Get ASN data
+        if asn_db:
+            try:
+                asn_response = asn_db.asn(source_ip)
+                geoip_data.update({
+                    'geoip_asn': {
+                        'asn': asn_response.autonomous_system_number,
+                        'as_org': asn_response.autonomous_system_organization
+                    }
+                })
+            except Exception as e:
+                logger.debug(f"ASN lookup failed for {source_ip}: {e}")
+        
+        return geoip_data
+
     def enrich_ip_data(self):
         """Enrich IP data in Elasticsearch with GeoIP information"""
         logger.info("Starting IP data enrichment...")
@@ -166,7 +271,7 @@ class GeoIPService:
             query = {
                 "query": {
                     "bool": {
-                        "must": [
+                        "filter": [
                             {"exists": {"field": "source_ip"}},
                             {"range": {"@timestamp": {"gte": "now-1h"}}}
                         ],
@@ -184,78 +289,47 @@ class GeoIPService:
                 logger.info("No IP addresses to enrich")
                 return
             
-            # Load GeoIP databases
-            city_db = None
-            asn_db = None
-            
-            city_path = os.path.join(self.geoip_dir, 'GeoLite2-City.mmdb')
-            asn_path = os.path.join(self.geoip_dir, 'GeoLite2-ASN.mmdb')
+            # Get GeoIP databases
+            city_db = self.get_reader('GeoLite2-City')
+            asn_db = self.get_reader('GeoLite2-ASN')
             
-            if os.path.exists(city_path):
-                city_db = geoip2.database.Reader(city_path)
+            # Look up each distinct public IP once, most hits come from a handful of sources
+            hits = response['hits']['hits']
+            unique_ips = [ip for ip in {hit['_source'].get('source_ip') for hit in hits} if ip and is_global_ip(ip)]
+            with ThreadPoolExecutor(max_workers=LOOKUP_WORKERS) as executor:
+                results = executor.map(lambda ip: self.lookup_ip(ip, city_db, asn_db), unique_ips,
+                                       timeout=LOOKUP_TIMEOUT)
+                geo_map = dict(zip(unique_ips, results))
             
-            if os.path.exists(asn_path):
-                asn_db = geoip2.database.Reader(asn_path)
+            # Queue a partial update for every hit we have GeoIP data for
+            actions = [
+                {
+                    '_op_type': 'update',
+                    '_index': hit['_index'],
+                    '_id': hit['_id'],
+                    'doc': geo_map[hit['_source']['source_ip']]
+                }
+                for hit in hits
+                if geo_map.get(hit['_source'].get('source_ip'))
+            ]
             
+            # Submit updates in bulk requests sent from a small thread pool,
+            # each request capped by count and size so large batches stay well under http.max_content_length
             enriched_count = 0
+            for ok, item in parallel_bulk(
+                self.es.options(request_timeout=60),
+                actions,
+                thread_count=4,
+                chunk_size=500,
+                max_chunk_bytes=5 * 1024 * 1024,
+                raise_on_error=False
+            ):
+                if ok:
+                    enriched_count += 1
+                else:
+                    logger.error(f"Failed to update document: {item}")
             
-            for hit in response['hits']['hits']:
-                source_ip = hit['_source'].get('source_ip')
-                if not source_ip:
-                    continue
-                
-                geoip_data = {}
-                
-                # Get city/country data
-                if city_db:
-                    try:
-                        city_response = city_db.city(source_ip)
-                        geoip_data.update({
-                            'geoip': {
-                                'country_name': city_response.country.name,
-                                'country_code': city_response.country.iso_code,
-                                'city_name': city_response.city.name,
-                                'continent_code': city_response.continent.code,
-                                'latitude': float(city_response.location.latitude) if city_response.location.latitude else None,
-                                'longitude': float(city_response.location.longitude) if city_response.location.longitude else None,
-                                'timezone': city_response.location.time_zone
-                            }
-                        })
-                    except Exception as e:
-                        logger.debug(f"City lookup failed for {source_ip}: {e}")
-                
-                # Get ASN data
-                if asn_db:
-                    try:
-                        asn_response = asn_db.asn(source_ip)
-                        geoip_data.update({
-                            'geoip_asn': {
-                                'asn': asn_response.autonomous_system_number,
-                                'as_org': asn_response.autonomous_system_organization
-                            }
-                        })
-                    except Exception as e:
-                        logger.debug(f"ASN lookup failed for {source_ip}: {e}")
-                
-                # Update document if we have GeoIP data
-                if geoip_data:
-                    try:
-                        self.es.update(
-                            index=hit['_index'],
-                            id=hit['_id'],
-                            body={'doc': geoip_data}
-                        )
-                        enriched_count += 1
-                    except Exception as e:
-                        logger.error(f"Failed to update document {hit['_id']}: {e}")
-            
-            logger.info(f"Enriched {enriched_count} IP addresses")
-            
-            # Close databases
-            if city_db:
-                city_db.close()
-            if asn_db:
-                asn_db.close()
+            logger.info(f"Enriched {enriched_count} documents from {len(geo_map)} IP addresses")
                 
         except Exception as e:
             logger.error(f"Error during IP enrichment: {e}")
@@ -268,24 +342,27 @@ class GeoIPService:
         self.update_databases()
         self.test_databases()
         
+        # Jobs fire on their own triggers. A single worker thread runs them one at a time, so a
+        # database update never overlaps enrichment and the cached readers need no locking.
+        # A job held up behind the other still runs once it is free rather than being dropped as missed
+        scheduler = BlockingScheduler(executors={'default': {'type': 'threadpool', 'max_workers': 1}})
+        
         # Schedule database updates (weekly)
-        schedule.every().sunday.at("02:00").do(self.update_databases)
+        scheduler.add_job(self.update_databases, 'cron', day_of_week='sun', hour=2,
+                          max_instances=1, coalesce=True, misfire_grace_time=None)
         
         # Schedule IP enrichment (every 5 minutes)
-        schedule.every(5).minutes.do(self.enrich_ip_data)
+        scheduler.add_job(self.enrich_ip_data, 'interval', minutes=5,
+                          max_instances=1, coalesce=True, misfire_grace_time=None)
         
         logger.info("GeoIP service started. Scheduling tasks...")
         
-        while True:
-            try:
-                schedule.run_pending()
-                time.sleep(60)  # Check every minute
-            except KeyboardInterrupt:
-                logger.info("Shutting down GeoIP service...")
-                break
-            except Exception as e:
-                logger.error(f"Error in main loop: {e}")
-                time.sleep(60)
+        try:
+            scheduler.start()
+        except (KeyboardInterrupt, SystemExit):
+            logger.info("Shutting down GeoIP service...")
+        finally:
+            self.close_readers()
 
 def main():
     """Main function"""
@@ -7,12 +7,21 @@ Monitors the health of all honeypot services and infrastructure
 import os
 import logging
 import time
-import json
-from datetime import datetime
+import errno
+import selectors
+import socket
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
 import requests
-import schedule
+from requests.adapters import HTTPAdapter
 from elasticsearch import Elasticsearch
+from elasticsearch.serializer import JsonSerializer, NdjsonSerializer
+from elasticsearch.helpers import bulk
+from apscheduler.schedulers.blocking import BlockingScheduler
 import docker
+from prometheus_client import Gauge, start_http_server
+import orjson
 
 # Configure logging
 logging.basicConfig(
@@ -21,16 +30,99 @@ logging.basicConfig(
 )
 logger = logging.getLogger('health_monitor')
 
+# Upper bound on the wall time of one round of service checks
+CHECK_TIMEOUT = 15
+
+# Per-call timeouts for Elasticsearch and Docker, so one hung backend cannot stall a cycle
+ES_TIMEOUT = 5
+CLEANUP_TIMEOUT = 60
+DOCKER_TIMEOUT = 10
+STATS_TIMEOUT = 5
+
+# Host cgroup v2 tree, read directly for container usage; the Docker stats API is the fallback
+CGROUP_ROOT = os.getenv('CGROUP_ROOT', '/sys/fs/cgroup')
+CGROUP_SAMPLE = 0.2
+
+# Health documents are buffered and indexed in bulk every few cycles, or sooner if the buffer fills
+FLUSH_CYCLES = 5
+FLUSH_DOCS = 50
+BULK_TIMEOUT = 30
+
+# Health data is written to daily indices and expired by dropping whole indices
+HEALTH_INDEX_PREFIX = 'honeypot-health-'
+LEGACY_HEALTH_INDEX = 'honeypot-health'
+RETENTION_DAYS = 7
+
+# Settings for the health indices, nothing reads them in real time so refresh and fsync lazily
+HEALTH_INDEX_SETTINGS = {
+    'index.refresh_interval': '30s',
+    'index.number_of_replicas': 0,
+    'index.translog.durability': 'async'
+}
+
+# Check cadence: widens while everything is healthy, drops to the minimum on any problem
+MIN_CHECK_INTERVAL = int(os.getenv('CHECK_INTERVAL', '30'))
+MAX_CHECK_INTERVAL = 300
+DEFAULT_CHECK_INTERVAL = 120
+CHECK_BACKOFF = 1.5
+
+# Connect timeout for TCP port probes
+PORT_TIMEOUT = 5
+
+# Prometheus endpoint for the per-cycle gauges, scraped instead of queried from Elasticsearch
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9101'))
+SERVICE_UP = Gauge('honeypot_service_up', 'Whether the last probe of a service was healthy', ['service'])
+SERVICES_HEALTHY = Gauge('honeypot_services_healthy', 'Number of healthy services in the last check')
+OVERALL_STATUS = Gauge('honeypot_overall_status', 'Overall status of the last check', ['status'])
+CONTAINER_CPU = Gauge('honeypot_container_cpu_percent', 'Container CPU usage', ['name'])
+CONTAINER_MEMORY = Gauge('honeypot_container_memory_percent', 'Container memory usage', ['name'])
+CONTAINER_RUNNING = Gauge('honeypot_container_running', 'Whether a container is running', ['name'])
+INDEX_DOCS = Gauge('honeypot_index_docs', 'Documents per honeypot index', ['index'])
+INDEX_SIZE = Gauge('honeypot_index_size_bytes', 'Store size per honeypot index', ['index'])
+LOGS_PER_MINUTE = Gauge('honeypot_logs_per_minute', 'Log ingestion rate over the last 5 minutes')
+SERVICE_LOGS_PER_MINUTE = Gauge('honeypot_service_logs_per_minute', 'Log ingestion rate per service over the last 5 minutes', ['service'])
+OVERALL_STATUSES = ('healthy', 'degraded', 'critical')
+
+class OrjsonSerializer(JsonSerializer):
+    """Elasticsearch JSON serializer backed by orjson"""
+    
+    def json_dumps(self, data):
+        return orjson.dumps(data, default=self.default)
+    
+    def json_loads(self, data):
+        return orjson.loads(data)
+
+class OrjsonNdjsonSerializer(NdjsonSerializer):
+    """Elasticsearch NDJSON serializer for bulk bodies, one orjson line per action"""
+    
+    def json_dumps(self, data):
+        return orjson.dumps(data, default=self.default)
+    
+    def json_loads(self, data):
+        return orjson.loads(data)
+
 class HealthMonitor:
     def __init__(self):
         self.elasticsearch_host = os.getenv('ELASTICSEARCH_HOST', 'http://elasticsearch:9200')
-        self.es = Elasticsearch([self.elasticsearch_host])
+        self.es = Elasticsearch(
+            [self.elasticsearch_host],
+            # Only a few checks talk to Elasticsearch at once, a small compressed keep-alive pool covers them
+            http_compress=True,
+            connections_per_node=4,
+            request_timeout=ES_TIMEOUT,
+            retry_on_timeout=True,
+            max_retries=2,
+            serializers={
+                'application/json': OrjsonSerializer(),
+                'application/x-ndjson': OrjsonNdjsonSerializer()
+            }
+        )
         
         # Initialize Docker client
         try:
-            self.docker_client = docker.from_env()
+            self.docker_client = docker.from_env(timeout=DOCKER_TIMEOUT)
         except Exception as e:
-            logger.warning(f"Could not initialize Docker client: {e}")
+            logger.warning("Could not initialize Docker client: %s", e)
             self.docker_client = None
         
         # Services to monitor
@@ -44,36 +136,158 @@ class HealthMonitor:
             'ftp_honeypot': {'port': 21, 'type': 'honeypot'},
             'telnet_honeypot': {'port': 23, 'type': 'honeypot'}
         }
+        
+        # Keep-alive connections to the HTTP endpoints, reused across check rounds
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=8, max_retries=0)
+        self.http.mount('http://', adapter)
+        self.http.mount('https://', adapter)
+        
+        # Probe closures specialised once per service config, TCP targets are also probed as one batch
+        self.probes = {name: self.build_probe(name, config) for name, config in self.services.items()}
+        self.port_targets = {
+            name: (name.replace('_', '-'), config['port'])
+            for name, config in self.services.items() if 'url' not in config and 'port' in config
+        }
+        
+        # Container stats calls, run apart from the check pool so they can be abandoned on timeout.
+        # Each call samples for about a second, so they are all issued at once to overlap those waits
+        self.stats_pool = ThreadPoolExecutor(max_workers=16)
+        
+        # Health documents waiting for the next bulk request, oldest dropped if ES stays unreachable
+        self.pending_docs = deque(maxlen=100)
+        self.cycles_since_flush = 0
+        
+        self.check_interval = DEFAULT_CHECK_INTERVAL
+        self.scheduler = None
+        
+        # Label values last set on each labelled gauge, to find series that have gone away
+        self.metric_labels = {}
+        
+        # Probes are independent and network bound, run them all at once,
+        # with room for the container, index and ingestion checks alongside them
+        self.check_pool = ThreadPoolExecutor(max_workers=len(self.services) + 3)
 
-    def check_service_health(self, service_name, config):
-        """Check health of a specific service"""
+    def ensure_health_index_template(self):
+        """Apply the health index settings to new and existing health indices"""
         try:
-            if 'url' in config:
-                # HTTP health check
-                response = requests.get(config['url'], timeout=10)
-                if response.status_code == 200:
-                    return {'status': 'healthy', 'response_time': response.elapsed.total_seconds()}
-                else:
-                    return {'status': 'unhealthy', 'error': f"HTTP {response.status_code}"}
+            self.es.options(request_timeout=ES_TIMEOUT).indices.put_index_template(
+                name='honeypot-health-tpl',
+                index_patterns=['honeypot-health*'],
+                template={'settings': HEALTH_INDEX_SETTINGS}
+            )
             
-            elif 'port' in config:
-                # Port connectivity check
-                import socket
+            # Templates only apply at index creation, update indices that already exist
+            self.es.options(request_timeout=ES_TIMEOUT).indices.put_settings(
+                index='honeypot-health*',
+                settings=HEALTH_INDEX_SETTINGS,
+                allow_no_indices=True
+            )
+        except Exception as e:
+            logger.error("Failed to apply health index settings: %s", e)
+
+    def build_probe(self, service_name, config):
+        """Resolve a service config into a ready-to-call probe"""
+        if 'url' in config:
+            return self.http_probe(config['url'])
+        elif 'port' in config:
+            return self.port_probe(service_name.replace('_', '-'), config['port'])
+        else:
+            unknown = {'status': 'unknown', 'error': 'No health check method configured'}
+            return lambda: dict(unknown)
+
+    def check_service_health(self, service_name):
+        """Check health of a specific service"""
+        try:
+            return self.probes[service_name]()
+        except Exception as e:
+            return {'status': 'unhealthy', 'error': str(e)}
+
+    def check_port_services(self, service_names):
+        """Check several TCP services with one batched probe"""
+        return self.probe_ports({service_name: self.port_targets[service_name] for service_name in service_names})
+
+    def http_probe(self, url):
+        """Build an HTTP health check bound to one URL"""
+        # Everything that does not depend on the response is worked out once here
+        get = self.http.get
+        timeout_result = {'status': 'timeout', 'error': f"No response from {url}"}
+        
+        def probe():
+            try:
+                response = get(url, timeout=(2, 5))
+            except requests.Timeout:
+                return dict(timeout_result)
+            if response.status_code == 200:
+                return {'status': 'healthy', 'response_time': response.elapsed.total_seconds()}
+            else:
+                return {'status': 'unhealthy', 'error': f"HTTP {response.status_code}"}
+        
+        return probe
+
+    def port_probe(self, host, port):
+        """Build a port connectivity check bound to one host and port"""
+        targets = {host: (host, port)}
+        probe_ports = self.probe_ports
+        
+        def probe():
+            return probe_ports(targets)[host]
+        
+        return probe
+
+    def probe_ports(self, targets):
+        """Connect to many TCP ports at once, waiting on all of them with one selector"""
+        results = {}
+        selector = selectors.DefaultSelector()
+        try:
+            for name, (host, port) in targets.items():
                 sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(5)
-                result = sock.connect_ex((service_name.replace('_', '-'), config['port']))
-                sock.close()
+                sock.setblocking(False)
+                try:
+                    result = sock.connect_ex((host, port))
+                except OSError as e:
+                    # Name resolution failures are raised rather than returned
+                    sock.close()
+                    results[name] = {'status': 'unhealthy', 'error': str(e)}
+                    continue
                 
-                if result == 0:
-                    return {'status': 'healthy', 'port': config['port']}
-                else:
-                    return {'status': 'unhealthy', 'error': f"Port {config['port']} not accessible"}
+                if result in (errno.EINPROGRESS, errno.EAGAIN):
+                    selector.register(sock, selectors.EVENT_WRITE, name)
+                    continue
+                sock.close()
+                results[name] = self.port_result(port, result)
             
-            else:
-                return {'status': 'unknown', 'error': 'No health check method configured'}
-                
-        except Exception as e:
-            return {'status': 'unhealthy', 'error': str(e)}
+            # Writable means the connect finished, SO_ERROR says whether it succeeded
+            deadline = time.monotonic() + PORT_TIMEOUT
+            while selector.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                for key, _ in selector.select(timeout=remaining):
+                    sock = key.fileobj
+                    error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    results[key.data] = self.port_result(targets[key.data][1], error)
+                    selector.unregister(sock)
+                    sock.close()
+            
+            # Whatever is still connecting has timed out
+            for key in list(selector.get_map().values()):
+                results[key.data] = self.port_result(targets[key.data][1], errno.ETIMEDOUT)
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+        finally:
+            selector.close()
+        
+        return results
+
+    def port_result(self, port, error):
+        """Build a port check result from a connect error code"""
+        if error == 0:
+            return {'status': 'healthy', 'port': port}
+        elif error == errno.ETIMEDOUT:
+            return {'status': 'timeout', 'error': f"Port {port} connect timed out"}
+        else:
+            return {'status': 'unhealthy', 'error': f"Port {port} not accessible"}
 
     def check_docker_containers(self):
         """Check Docker container health"""
@@ -84,41 +298,34 @@ class HealthMonitor:
         
         try:
             containers = self.docker_client.containers.list(all=True)
+            running = [container for container in containers if container.status == 'running']
+            
+            # Containers with a readable cgroup are sampled directly, the rest go through the stats API.
+            # Stats requests are all made up front, then collected against one deadline
+            cgroup_paths = {}
+            for container in running:
+                path = self.cgroup_path(container.id)
+                if path:
+                    cgroup_paths[container.id] = path
+            stats_futures = {
+                container.id: self.stats_pool.submit(container.stats, stream=False)
+                for container in running if container.id not in cgroup_paths
+            }
+            deadline = time.monotonic() + STATS_TIMEOUT
+            cgroup_stats = self.sample_cgroups(cgroup_paths)
             
             for container in containers:
                 name = container.name
                 status = container.status
                 
                 # Get container stats if running
-                stats = {}
-                if status == 'running':
+                stats = cgroup_stats.get(container.id, {})
+                if container.id in stats_futures:
                     try:
-                        container_stats = container.stats(stream=False)
-                        
-                        # Calculate CPU usage
-                        cpu_delta = container_stats['cpu_stats']['cpu_usage']['total_usage'] - \
-                                   container_stats['precpu_stats']['cpu_usage']['total_usage']
-                        system_delta = container_stats['cpu_stats']['system_cpu_usage'] - \
-                                      container_stats['precpu_stats']['system_cpu_usage']
-                        
-                        if system_delta > 0:
-                            cpu_percent = (cpu_delta / system_delta) * 100.0
-                        else:
-                            cpu_percent = 0.0
-                        
-                        # Calculate memory usage
-                        memory_usage = container_stats['memory_stats']['usage']
-                        memory_limit = container_stats['memory_stats']['limit']
-                        memory_percent = (memory_usage / memory_limit) * 100.0
-                        
-                        stats = {
-                            'cpu_percent': round(cpu_percent, 2),
-                            'memory_usage_mb': round(memory_usage / 1024 / 1024, 2),
-                            'memory_percent': round(memory_percent, 2)
-                        }
-                        
+                        container_stats = stats_futures[container.id].result(timeout=max(0, deadline - time.monotonic()))
+                        stats = self.container_usage(container_stats)
                     except Exception as e:
-                        logger.debug(f"Could not get stats for {name}: {e}")
+                        logger.debug("Could not get stats for %s: %s", name, e)
                 
                 container_health[name] = {
                     'status': status,
@@ -127,47 +334,144 @@ class HealthMonitor:
                 }
                 
         except Exception as e:
-            logger.error(f"Error checking Docker containers: {e}")
+            logger.error("Error checking Docker containers: %s", e)
         
         return container_health
 
+    def cgroup_path(self, container_id):
+        """Find the cgroup v2 directory of a container, for the systemd or cgroupfs driver"""
+        for path in (os.path.join(CGROUP_ROOT, 'system.slice', f'docker-{container_id}.scope'),
+                     os.path.join(CGROUP_ROOT, 'docker', container_id)):
+            if os.path.isfile(os.path.join(path, 'cpu.stat')):
+                return path
+        return None
+
+    def read_cgroup(self, path):
+        """Read CPU time in microseconds, memory usage and memory limit from a cgroup"""
+        with open(os.path.join(path, 'cpu.stat')) as f:
+            usage_usec = next(int(line.split()[1]) for line in f if line.startswith('usage_usec '))
+        with open(os.path.join(path, 'memory.current')) as f:
+            memory_usage = int(f.read())
+        with open(os.path.join(path, 'memory.max')) as f:
+            memory_max = f.read().strip()
+        
+        # Unlimited containers are bounded by host memory, as the stats API reports
+        if memory_max == 'max':
+            memory_limit = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        else:
+            memory_limit = int(memory_max)
+        return usage_usec, memory_usage, memory_limit
+
+    def sample_cgroups(self, cgroup_paths):
+        """Compute usage for all cgroups from two reads one short sample apart"""
+        first = {}
+        for container_id, path in cgroup_paths.items():
+            try:
+                first[container_id] = (time.monotonic_ns(), self.read_cgroup(path)[0])
+            except (OSError, ValueError, StopIteration) as e:
+                logger.debug("Could not read cgroup %s: %s", path, e)
+        
+        if not first:
+            return {}
+        time.sleep(CGROUP_SAMPLE)
+        
+        # CPU is a share of the whole host, like the stats API system delta
+        cpus = os.cpu_count() or 1
+        usage = {}
+        for container_id, (started_ns, started_usec) in first.items():
+            try:
+                usage_usec, memory_usage, memory_limit = self.read_cgroup(cgroup_paths[container_id])
+            except (OSError, ValueError, StopIteration) as e:
+                logger.debug("Could not read cgroup %s: %s", cgroup_paths[container_id], e)
+                continue
+            wall_usec = (time.monotonic_ns() - started_ns) / 1000
+            cpu_percent = (usage_usec - started_usec) / wall_usec / cpus * 100.0 if wall_usec > 0 else 0.0
+            usage[container_id] = {
+                'cpu_percent': round(cpu_percent, 2),
+                'memory_usage_mb': round(memory_usage / 1024 / 1024, 2),
+                'memory_percent': round((memory_usage / memory_limit) * 100.0, 2)
+            }
+        return usage
+
+    def container_usage(self, container_stats):
+        """Compute CPU and memory usage from a Docker stats sample"""
+        # Calculate CPU usage
+        cpu_delta = container_stats['cpu_stats']['cpu_usage']['total_usage'] - \
+                   container_stats['precpu_stats']['cpu_usage']['total_usage']
+        system_delta = container_stats['cpu_stats']['system_cpu_usage'] - \
+                      container_stats['precpu_stats']['system_cpu_usage']
+        
+        if system_delta > 0:
+            cpu_percent = (cpu_delta / system_delta) * 100.0
+        else:
+            cpu_percent = 0.0
+        
+        # Calculate memory usage
+        memory_usage = container_stats['memory_stats']['usage']
+        memory_limit = container_stats['memory_stats']['limit']
+        memory_percent = (memory_usage / memory_limit) * 100.0
+        
+        return {
+            'cpu_percent': round(cpu_percent, 2),
+            'memory_usage_mb': round(memory_usage / 1024 / 1024, 2),
+            'memory_percent': round(memory_percent, 2)
+        }
+
     def check_elasticsearch_indices(self):
         """Check Elasticsearch indices health"""
         try:
-            # Get index health
-            indices_health = self.es.cat.indices(index="honeypot-*", format="json")
+            # Get index health, only the columns we report and sizes in plain bytes
+            indices_health = self.es.options(request_timeout=ES_TIMEOUT).cat.indices(
+                index="honeypot-*",
+                format="json",
+                h='index,health,status,docs.count,store.size',
+                bytes='b'
+            )
             
-            index_info = {}
-            for index in indices_health:
-                index_info[index['index']] = {
+            # Closed indices report no counts
+            index_info = {
+                index['index']: {
                     'health': index['health'],
                     'status': index['status'],
-                    'docs_count': int(index['docs.count']) if index['docs.count'] != 'null' else 0,
-                    'store_size': index['store.size']
+                    'docs_count': int(index['docs.count'] or 0),
+                    'store_size_bytes': int(index['store.size'] or 0)
                 }
+                for index in indices_health
+            }
             
             return index_info
             
         except Exception as e:
-            logger.error(f"Error checking Elasticsearch indices: {e}")
+            logger.error("Error checking Elasticsearch indices: %s", e)
             return {}
 
     def check_log_ingestion_rate(self):
         """Check log ingestion rate"""
         try:
-            # Check logs from last 5 minutes
+            # Check logs from the last 5 whole minutes, counts only, in filter context.
+            # Minute-aligned bounds keep the window exactly 5 minutes and let the shard request cache reuse it
             query = {
+                "size": 0,
+                "track_total_hits": True,
                 "query": {
-                    "range": {"@timestamp": {"gte": "now-5m"}}
+                    "bool": {
+                        "filter": [
+                            {"range": {"@timestamp": {"gte": "now-5m/m", "lt": "now/m"}}}
+                        ]
+                    }
                 },
                 "aggs": {
                     "by_service": {
-                        "terms": {"field": "service", "size": 10}
+                        "terms": {"field": "service", "size": 10, "execution_hint": "map"}
                     }
                 }
             }
             
-            response = self.es.search(index="honeypot-logs-*", body=query)
+            response = self.es.options(request_timeout=ES_TIMEOUT).search(
+                index="honeypot-logs-*",
+                body=query,
+                request_cache=True
+            )
             
             total_logs = response['hits']['total']['value']
             logs_per_minute = total_logs / 5
@@ -183,7 +487,7 @@ class HealthMonitor:
             }
             
         except Exception as e:
-            logger.error(f"Error checking log ingestion rate: {e}")
+            logger.error("Error checking log ingestion rate: %s", e)
             return {}
 
     def run_health_checks(self):
@@ -199,24 +503,46 @@ class HealthMonitor:
             'overall_status': 'healthy'
         }
         
-        # Check services
+        # Start the Docker, index and ingestion checks so they overlap with the service probes
+        containers_future = self.check_pool.submit(self.check_docker_containers)
+        indices_future = self.check_pool.submit(self.check_elasticsearch_indices)
+        ingestion_future = self.check_pool.submit(self.check_log_ingestion_rate)
+        
+        # Check services concurrently, a hung probe only costs CHECK_TIMEOUT.
+        # HTTP services get a task each, TCP services share one batched probe (mapped to None)
+        futures = {
+            self.check_pool.submit(self.check_service_health, service_name): service_name
+            for service_name in self.services if service_name not in self.port_targets
+        }
+        if self.port_targets:
+            futures[self.check_pool.submit(self.check_port_services, list(self.port_targets))] = None
+        results = {}
+        try:
+            for future in as_completed(futures, timeout=CHECK_TIMEOUT):
+                if futures[future] is None:
+                    results.update(future.result())
+                else:
+                    results[futures[future]] = future.result()
+        except TimeoutError:
+            logger.warning("Health checks did not finish within %ds", CHECK_TIMEOUT)
+        
         unhealthy_services = 0
-        for service_name, config in self.services.items():
-            health = self.check_service_health(service_name, config)
+        for service_name in self.services:
+            health = results.get(service_name, {'status': 'timeout', 'error': 'Health check timed out'})
             health_report['services'][service_name] = health
             
             if health['status'] != 'healthy':
                 unhealthy_services += 1
-                logger.warning(f"Service {service_name} is unhealthy: {health.get('error', 'Unknown error')}")
+                logger.warning("Service %s is unhealthy: %s", service_name, health.get('error', 'Unknown error'))
         
         # Check Docker containers
-        health_report['containers'] = self.check_docker_containers()
+        health_report['containers'] = containers_future.result()
         
         # Check Elasticsearch indices
-        health_report['elasticsearch_indices'] = self.check_elasticsearch_indices()
+        health_report['elasticsearch_indices'] = indices_future.result()
         
         # Check log ingestion
-        health_report['log_ingestion'] = self.check_log_ingestion_rate()
+        health_report['log_ingestion'] = ingestion_future.result()
         
         # Determine overall status
         if unhealthy_services > 0:
@@ -225,20 +551,114 @@ class HealthMonitor:
             else:
                 health_report['overall_status'] = 'degraded'
         
-        # Log health report to Elasticsearch
-        try:
-            self.es.index(
-                index='honeypot-health',
-                body=health_report
-            )
-        except Exception as e:
-            logger.error(f"Failed to log health report to Elasticsearch: {e}")
+        # Per-cycle numbers go to the metrics endpoint
+        self.record_metrics(health_report)
+        
+        # Queue the health report for today's health index, plus an incident document per unhealthy service
+        index_name = f"{HEALTH_INDEX_PREFIX}{datetime.utcnow():%Y.%m.%d}"
+        self.pending_docs.append({'_index': index_name, '_source': health_report})
+        for service_name, health in health_report['services'].items():
+            if health['status'] == 'healthy':
+                continue
+            self.pending_docs.append({
+                '_index': index_name,
+                '_source': {
+                    'timestamp': health_report['timestamp'],
+                    'doc_type': 'service_check',
+                    'service': service_name,
+                    'service_type': self.services[service_name]['type'],
+                    **health
+                }
+            })
+        self.cycles_since_flush += 1
+        
+        # Problems are written straight away, steady-state reports wait for a fuller batch
+        if (health_report['overall_status'] != 'healthy' or self.cycles_since_flush >= FLUSH_CYCLES
+                or len(self.pending_docs) >= FLUSH_DOCS):
+            self.flush_health_docs()
         
         # Log summary
         healthy_count = len(self.services) - unhealthy_services
-        logger.info(f"Health check completed: {healthy_count}/{len(self.services)} services healthy, "
-                   f"overall status: {health_report['overall_status']}")
+        logger.info("Health check completed: %d/%d services healthy, overall status: %s",
+                   healthy_count, len(self.services), health_report['overall_status'])
+        
+        return health_report
+
+    def record_metrics(self, health_report):
+        """Update the Prometheus gauges from a health report"""
+        healthy_count = 0
+        for service_name, health in health_report['services'].items():
+            up = health['status'] == 'healthy'
+            healthy_count += up
+            SERVICE_UP.labels(service_name).set(1 if up else 0)
+        SERVICES_HEALTHY.set(healthy_count)
         
+        for status in OVERALL_STATUSES:
+            OVERALL_STATUS.labels(status).set(1 if health_report['overall_status'] == status else 0)
+        
+        # Failed checks return nothing, keep the last values then
+        containers = health_report['containers']
+        if containers:
+            self.set_gauge(CONTAINER_RUNNING, {
+                name: 1 if container['status'] == 'running' else 0 for name, container in containers.items()
+            })
+            self.set_gauge(CONTAINER_CPU, {
+                name: container['stats']['cpu_percent'] for name, container in containers.items() if container['stats']
+            })
+            self.set_gauge(CONTAINER_MEMORY, {
+                name: container['stats']['memory_percent'] for name, container in containers.items() if container['stats']
+            })
+        
+        indices = health_report['elasticsearch_indices']
+        if indices:
+            self.set_gauge(INDEX_DOCS, {index: info['docs_count'] for index, info in indices.items()})
+            self.set_gauge(INDEX_SIZE, {index: info['store_size_bytes'] for index, info in indices.items()})
+        
+        ingestion = health_report['log_ingestion']
+        if ingestion:
+            LOGS_PER_MINUTE.set(ingestion['logs_per_minute'])
+            self.set_gauge(SERVICE_LOGS_PER_MINUTE, ingestion['service_rates'])
+
+    def set_gauge(self, gauge, values):
+        """Set a labelled gauge in place and remove only the labels no longer reported"""
+        # Scrapes run on another thread, so live series are never cleared and re-added
+        for label, value in values.items():
+            gauge.labels(label).set(value)
+        for label in self.metric_labels.get(gauge, set()) - values.keys():
+            gauge.remove(label)
+        self.metric_labels[gauge] = set(values)
+
+    def flush_health_docs(self):
+        """Index all buffered health documents in one bulk request"""
+        if not self.pending_docs:
+            return
+        
+        try:
+            indexed, errors = bulk(
+                self.es.options(request_timeout=BULK_TIMEOUT),
+                list(self.pending_docs),
+                chunk_size=500,
+                raise_on_error=False
+            )
+            for error in errors:
+                logger.error("Failed to index health document: %s", error)
+            self.pending_docs.clear()
+            self.cycles_since_flush = 0
+        except Exception as e:
+            # Keep the buffer and retry on the next cycle
+            logger.error("Failed to log health report to Elasticsearch: %s", e)
+
+    def run_scheduled_check(self):
+        """Run a round of health checks and adapt the interval to the result"""
+        health_report = self.run_health_checks()
+        previous_interval = self.check_interval
+        if health_report['overall_status'] == 'healthy':
+            self.check_interval = min(MAX_CHECK_INTERVAL, self.check_interval * CHECK_BACKOFF)
+        else:
+            self.check_interval = MIN_CHECK_INTERVAL
+        if self.scheduler is not None and self.check_interval != previous_interval:
+            self.scheduler.reschedule_job('health_check', trigger='interval', seconds=self.check_interval)
+        logger.debug("Next health check in %.0fs", self.check_interval)
         return health_report
 
     def check_disk_space(self):
@@ -258,65 +678,98 @@ class HealthMonitor:
             
             # Log warning if disk usage is high
             if disk_info['used_percent'] > 80:
-                logger.warning(f"High disk usage: {disk_info['used_percent']}%")
+                logger.warning("High disk usage: %s%%", disk_info['used_percent'])
             
             return disk_info
             
         except Exception as e:
-            logger.error(f"Error checking disk space: {e}")
+            logger.error("Error checking disk space: %s", e)
             return {}
 
     def cleanup_old_health_data(self):
         """Clean up old health monitoring data"""
         try:
-            # Delete health data older than 7 days
-            query = {
-                "query": {
-                    "range": {
-                        "timestamp": {
-                            "lt": "now-7d"
+            # Drop daily health indices older than the retention period
+            cutoff = (datetime.utcnow() - timedelta(days=RETENTION_DAYS)).date()
+            indices = self.es.options(request_timeout=ES_TIMEOUT).cat.indices(
+                index=f"{HEALTH_INDEX_PREFIX}*",
+                h='index',
+                format='json'
+            )
+            
+            old_indices = []
+            for index in indices:
+                try:
+                    index_date = datetime.strptime(index['index'][len(HEALTH_INDEX_PREFIX):], '%Y.%m.%d').date()
+                except ValueError:
+                    continue
+                if index_date < cutoff:
+                    old_indices.append(index['index'])
+            
+            if old_indices:
+                self.es.options(request_timeout=CLEANUP_TIMEOUT, ignore_status=404).indices.delete(
+                    index=','.join(old_indices)
+                )
+                logger.info("Deleted %d old health indices", len(old_indices))
+            
+            # Expire the pre-daily single index by query until it is empty, then drop it
+            if self.es.options(request_timeout=ES_TIMEOUT).indices.exists(index=LEGACY_HEALTH_INDEX):
+                query = {
+                    "query": {
+                        "range": {
+                            "timestamp": {
+                                "lt": f"now-{RETENTION_DAYS}d"
+                            }
                         }
                     }
                 }
-            }
-            
-            result = self.es.delete_by_query(
-                index="honeypot-health",
-                body=query
-            )
-            
-            deleted_count = result.get('deleted', 0)
-            if deleted_count > 0:
-                logger.info(f"Cleaned up {deleted_count} old health records")
+                
+                result = self.es.options(request_timeout=CLEANUP_TIMEOUT).delete_by_query(
+                    index=LEGACY_HEALTH_INDEX,
+                    body=query,
+                    refresh=True
+                )
+                
+                deleted_count = result.get('deleted', 0)
+                if deleted_count > 0:
+                    logger.info("Cleaned up %d old health records", deleted_count)
+                
+                if self.es.options(request_timeout=ES_TIMEOUT).count(index=LEGACY_HEALTH_INDEX)['count'] == 0:
+                    self.es.options(request_timeout=ES_TIMEOUT, ignore_status=404).indices.delete(index=LEGACY_HEALTH_INDEX)
+                    logger.info("Deleted empty legacy index %s", LEGACY_HEALTH_INDEX)
             
         except Exception as e:
-            logger.error(f"Error cleaning up old health data: {e}")
+            logger.error("Error cleaning up old health data: %s", e)
 
     def run(self):
         """Run the health monitoring service"""
         logger.info("Starting health monitoring service...")
         
-        # Schedule health checks every 2 minutes
-        schedule.every(2).minutes.do(self.run_health_checks)
+        self.ensure_health_index_template()
+        
+        # Serve the metrics from a background thread
+        start_http_server(METRICS_PORT)
+        
+        # Jobs fire on their own triggers; the check job is rescheduled as its interval adapts
+        self.scheduler = BlockingScheduler()
+        
+        # Run the first health check immediately, then on the adaptive interval
+        self.scheduler.add_job(self.run_scheduled_check, 'interval', seconds=self.check_interval,
+                               id='health_check', next_run_time=datetime.now(),
+                               max_instances=1, coalesce=True)
         
         # Schedule cleanup every day
-        schedule.every().day.at("03:00").do(self.cleanup_old_health_data)
+        self.scheduler.add_job(self.cleanup_old_health_data, 'cron', hour=3,
+                               max_instances=1, coalesce=True)
         
         logger.info("Health monitoring service started. Scheduling checks...")
         
-        # Run initial health check
-        self.run_health_checks()
-        
-        while True:
-            try:
-                schedule.run_pending()
-                time.sleep(30)  # Check every 30 seconds
-            except KeyboardInterrupt:
-                logger.info("Shutting down health monitoring service...")
-                break
-            except Exception as e:
-                logger.error(f"Error in main loop: {e}")
-                time.sleep(30)
+        try:
+            self.scheduler.start()
+        except (KeyboardInterrupt, SystemExit):
+            logger.info("Shutting down health monitoring service...")
+        finally:
+            self.flush_health_docs()
 
 def main():
     """Main function"""